@@ -0,0 +1,177 @@
+from fastapi import APIRouter, FastAPI, Depends, HTTPException, Header, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import Optional
+
+from database import get_async_db
+from read_routing import get_async_read_db
+from models import User, Session, Guide, Step, ExportJob
+from schemas import StepCreate, StepResponse, StepBatchCreate, StepBatchResponse, GuideResponse, ExportResponse
+from auth import get_current_user_async
+from steps import attach_screenshot_urls, batch_step_rows, batch_insert_statement, check_screenshot_keys
+from exports import export_response
+from conditional import etag_matches, set_etag, not_modified, guide_state_statement, guide_etag
+from job_queue import enqueue_job, enqueue_jobs, DERIVATIVES_QUEUE
+
+# Async (asyncpg) versions of the highest-traffic endpoints: recorder step
+# ingestion, guide reads and export polling. When DATABASE_ASYNC=true main.py
+# calls install() to swap them in for the sync versions; everything else stays
+# on the sync engine in the threadpool. Request/response contracts, replica
+# routing (reads) and pool metrics match the sync versions.
+
+router = APIRouter()
+
+async def _find_step_by_idempotency_key(db: AsyncSession, tenant_id: int, idempotency_key: Optional[str]) -> Optional[Step]:
+    if not idempotency_key:
+        return None
+    result = await db.execute(select(Step).where(
+        Step.tenant_id == tenant_id,
+        Step.idempotency_key == idempotency_key
+    ))
+    return result.scalars().first()
+
+async def _session_exists(db: AsyncSession, session_id: int, tenant_id: int) -> bool:
+    result = await db.execute(select(Session.id).where(
+        Session.id == session_id,
+        Session.tenant_id == tenant_id
+    ))
+    return result.first() is not None
+
+@router.post("/v1/steps", response_model=StepResponse)
+async def create_step(
+    step_data: StepCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async)
+):
+    """Append a step to a session"""
+    if not await _session_exists(db, step_data.session_id, current_user.tenant_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    check_screenshot_keys(current_user.tenant_id, [step_data])
+
+    existing = await _find_step_by_idempotency_key(db, current_user.tenant_id, step_data.idempotency_key)
+    if existing:
+        return existing
+
+    step = Step(
+        tenant_id=current_user.tenant_id,
+        session_id=step_data.session_id,
+        index=step_data.index,
+        title=step_data.title,
+        description=step_data.description,
+        screenshot_key=step_data.screenshot_key,
+        action_type=step_data.action_type,
+        action_context=step_data.action_context,
+        idempotency_key=step_data.idempotency_key
+    )
+    db.add(step)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # A concurrent retry with the same idempotency key won
+        await db.rollback()
+        existing = await _find_step_by_idempotency_key(db, current_user.tenant_id, step_data.idempotency_key)
+        if existing:
+            return existing
+        raise
+    await db.refresh(step)
+
+    await run_in_threadpool(enqueue_job, DERIVATIVES_QUEUE, step.id)
+
+    return step
+
+@router.post("/v1/sessions/{session_id}/steps:batch", response_model=StepBatchResponse)
+async def create_steps_batch(
+    session_id: int,
+    batch: StepBatchCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async)
+):
+    """Append many steps to a session in one transaction (see the sync version in main.py)"""
+    if not await _session_exists(db, session_id, current_user.tenant_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    check_screenshot_keys(current_user.tenant_id, batch.steps)
+
+    rows = batch_step_rows(current_user.tenant_id, session_id, batch.steps)
+    keys = [row["idempotency_key"] for row in rows]
+
+    created = dict((await db.execute(batch_insert_statement(rows))).all())
+    ids_by_key = {key: step_id for step_id, key in created.items()}
+
+    missing = [key for key in set(keys) if key not in ids_by_key]
+    if missing:
+        result = await db.execute(select(Step.id, Step.idempotency_key).where(
+            Step.tenant_id == current_user.tenant_id,
+            Step.idempotency_key.in_(missing)
+        ))
+        ids_by_key.update((key, step_id) for step_id, key in result.all())
+    await db.commit()
+
+    await run_in_threadpool(enqueue_jobs, DERIVATIVES_QUEUE, sorted(created))
+
+    return StepBatchResponse(step_ids=[ids_by_key[key] for key in keys], created=len(created))
+
+@router.get("/v1/guides/{guide_id}", response_model=GuideResponse)
+async def get_guide(
+    guide_id: int,
+    response: Response,
+    variant: str = Query("preview", pattern="^(thumbnail|preview|print|original)$"),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: User = Depends(get_current_user_async)
+):
+    """Get a guide by ID. Screenshot URLs point at the requested variant.
+    Answers 304 without loading steps when If-None-Match has the current ETag."""
+    state = (await db.execute(guide_state_statement(current_user.tenant_id, guide_id))).first()
+
+    if not state:
+        raise HTTPException(status_code=404, detail="Guide not found")
+
+    etag = guide_etag(guide_id, state.version, state.updated_at, variant)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    result = await db.execute(select(Guide).options(selectinload(Guide.steps)).where(
+        Guide.id == guide_id,
+        Guide.tenant_id == current_user.tenant_id
+    ))
+    guide = result.scalars().first()
+
+    if not guide:
+        raise HTTPException(status_code=404, detail="Guide not found")
+
+    attach_screenshot_urls(guide.steps, variant)
+    set_etag(response, guide_etag(guide.id, guide.version, guide.updated_at, variant))
+
+    return guide
+
+@router.get("/v1/exports/{job_id}", response_model=ExportResponse)
+async def get_export_status(
+    job_id: int,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: User = Depends(get_current_user_async)
+):
+    """Get export job status"""
+    result = await db.execute(select(ExportJob).where(
+        ExportJob.id == job_id,
+        ExportJob.tenant_id == current_user.tenant_id
+    ))
+    job = result.scalars().first()
+
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+
+    return export_response(job)
+
+def install(app: FastAPI):
+    """Replace the app's sync routes for these paths and methods with the async
+    ones, in place, so each is registered once and route order is unchanged.
+    Call after every sync route is defined."""
+    replacements = {(route.path, frozenset(route.methods)): route for route in router.routes}
+    for i, route in enumerate(app.router.routes):
+        key = (getattr(route, "path", None), frozenset(getattr(route, "methods", None) or ()))
+        if key in replacements:
+            app.router.routes[i] = replacements.pop(key)
+    app.router.routes.extend(replacements.values())
@@ -1,16 +1,24 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime, timedelta
 from typing import Optional
+import hashlib
+import hmac
+import threading
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 import os
 from dotenv import load_dotenv
 
-from database import get_db
+from database import get_db, get_async_db
 from models import User
 from schemas import TokenData
+from principal_cache import principal_cache
+from metrics import registry
 
 load_dotenv()
 
@@ -18,20 +26,75 @@ SECRET_KEY = os.getenv("JWT_SECRET", "dev_jwt_secret_change_in_production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30 * 24 * 60  # 30 days
 
+# bcrypt costs ~100-250ms of CPU per call. Password work runs on its own small
+# pool so a login burst cannot take every request thread; beyond
+# PASSWORD_HASH_MAX_PENDING queued calls requests fail fast with a 503.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(max(1, min(4, os.cpu_count() or 1)))))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(PASSWORD_HASH_WORKERS * 4)))
+PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", "5"))  # seconds a caller waits, queueing included
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+PASSWORD_SECONDS = registry.histogram("snapstep_password_hash_seconds", "Password hash/verify time, queueing included")
+PASSWORD_REJECTED = registry.counter("snapstep_password_hash_rejected_total", "Password operations rejected, by reason")
+
+class PasswordWorkOverloaded(Exception):
+    """Too much password hashing queued; the caller should retry later"""
+
+class PasswordExecutor:
+    """Bounded pool for password hashing. bcrypt releases the GIL, so threads
+    hash in parallel while the rest of the API keeps serving."""
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING,
+                 timeout: float = PASSWORD_HASH_TIMEOUT):
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending = 0
+        self._lock = threading.Lock()
+        registry.gauge("snapstep_password_hash_pending", "Password operations queued or running",
+                       function=lambda: self._pending)
+
+    def _release(self, _future):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def run(self, fn, *args):
+        """Run fn(*args) on the pool and wait for it; raises PasswordWorkOverloaded
+        when the queue is full or the result does not arrive within timeout"""
+        if not self._slots.acquire(blocking=False):
+            PASSWORD_REJECTED.inc(reason="queue_full")
+            raise PasswordWorkOverloaded()
+        with self._lock:
+            self._pending += 1
+        with PASSWORD_SECONDS.time():
+            future = self._pool.submit(fn, *args)
+            # The slot is held until the work finishes, even if we stop waiting
+            future.add_done_callback(self._release)
+            try:
+                return future.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                PASSWORD_REJECTED.inc(reason="timeout")
+                raise PasswordWorkOverloaded()
+
+password_executor = PasswordExecutor()
+
+def _verify_password(plain_password: str, hashed_password: str) -> bool:
     try:
         return pwd_context.verify(plain_password, hashed_password)
     except Exception:
         # Fallback for SHA256 hashes (used during initialization)
-        import hashlib
         sha256_hash = hashlib.sha256(plain_password.encode()).hexdigest()
-        return sha256_hash == hashed_password
+        return hmac.compare_digest(sha256_hash, hashed_password)
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return password_executor.run(_verify_password, plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return password_executor.run(pwd_context.hash, password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -53,29 +116,61 @@ def decode_token(token: str) -> Optional[TokenData]:
     except JWTError:
         return None
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
-    token = credentials.credentials
-    token_data = decode_token(token)
+
+def _check_active(user: User) -> User:
+    if not user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return user
+
+# Sync dependency: FastAPI runs it in the threadpool, so the lookup does not block the event loop
+def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
+) -> User:
+    token_data = decode_token(credentials.credentials)
     if token_data is None or token_data.email is None:
-        raise credentials_exception
+        raise _credentials_exception()
     
-    user = db.query(User).filter(User.email == token_data.email).first()
+    user = principal_cache.get(token_data.email)
     if user is None:
-        raise credentials_exception
+        user = db.query(User).filter(User.email == token_data.email).first()
+        if user is None:
+            raise _credentials_exception()
+        principal_cache.put(user)
     
-    if not user.is_active:
-        raise HTTPException(status_code=400, detail="Inactive user")
+    return _check_active(user)
+
+async def get_current_user_async(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db=Depends(get_async_db)
+) -> User:
+    """get_current_user for endpoints on the async engine"""
+    token_data = decode_token(credentials.credentials)
+    if token_data is None or token_data.email is None:
+        raise _credentials_exception()
     
-    return user
+    # The Redis tier is a blocking client; keep it off the event loop
+    if principal_cache.shared:
+        user = await run_in_threadpool(principal_cache.get, token_data.email)
+    else:
+        user = principal_cache.get(token_data.email)
+    if user is None:
+        result = await db.execute(select(User).where(User.email == token_data.email))
+        user = result.scalars().first()
+        if user is None:
+            raise _credentials_exception()
+        if principal_cache.shared:
+            await run_in_threadpool(principal_cache.put, user)
+        else:
+            principal_cache.put(user)
+    
+    return _check_active(user)
 
 async def get_current_admin(
     current_user: User = Depends(get_current_user)
@@ -0,0 +1,142 @@
+"""Concurrency benchmark for the API.
+
+Runs closed-loop clients against one endpoint and reports requests per second
+and latency percentiles. Compare the sync and async database modes by starting
+the API once with DATABASE_ASYNC=false and once with DATABASE_ASYNC=true:
+
+    python bench.py --path /v1/guides/1 --concurrency 64 --duration 30 --label sync
+    python bench.py --path /v1/guides/1 --concurrency 64 --duration 30 --label async
+
+With --login-storm N, N more clients log in back to back for the whole run;
+the output then shows login throughput (and 503s shed by the password pool)
+next to the latency of the measured endpoint:
+
+    python bench.py --path /v1/guides/1 --concurrency 16 --login-storm 64
+
+Standard library only, so it runs anywhere the API is reachable.
+"""
+import argparse
+import http.client
+import json
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlencode, urlsplit
+
+LOGIN_PATH = "/v1/auth/login"
+FORM_HEADERS = {"Content-Type": "application/x-www-form-urlencoded"}
+
+def login(base_url: str, email: str, password: str) -> str:
+    parts = urlsplit(base_url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+    body = urlencode({"email": email, "password": password})
+    conn.request("POST", LOGIN_PATH, body=body, headers=FORM_HEADERS)
+    response = conn.getresponse()
+    data = json.loads(response.read())
+    if response.status != 200:
+        raise SystemExit(f"Login failed ({response.status}): {data}")
+    return data["access_token"]
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+class Load:
+    """Closed-loop clients repeating one request until the deadline"""
+
+    def __init__(self, base_url: str, method: str, path: str, headers: dict, body: str = None):
+        self.parts = urlsplit(base_url)
+        self.method, self.path, self.headers, self.body = method, path, headers, body
+        self.latencies = []
+        self.errors = Counter()
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        return http.client.HTTPConnection(self.parts.hostname, self.parts.port or 80, timeout=60)
+
+    def client(self, deadline: float):
+        conn = self._connect()
+        latencies, errors = [], Counter()
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                conn.request(self.method, self.path, body=self.body, headers=self.headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 400:
+                    errors[response.status] += 1
+                else:
+                    latencies.append(time.perf_counter() - started)
+            except (OSError, http.client.HTTPException) as e:
+                errors[type(e).__name__] += 1
+                conn.close()
+                conn = self._connect()
+        conn.close()
+        with self._lock:
+            self.latencies.extend(latencies)
+            self.errors.update(errors)
+
+    def summary(self, elapsed: float) -> dict:
+        result = {
+            "requests": len(self.latencies),
+            "errors": dict(self.errors),
+            "rps": len(self.latencies) / elapsed,
+        }
+        if self.latencies:
+            for pct in (50, 95, 99):
+                result[f"p{pct}_ms"] = percentile(self.latencies, pct) * 1000
+        return result
+
+def run(loads, duration: float) -> float:
+    """Run [(load, clients)] together for duration seconds; returns elapsed time"""
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=load.client, args=(deadline,))
+        for load, clients in loads for _ in range(clients)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started
+
+def format_result(name: str, result: dict) -> str:
+    errors = ", ".join(f"{code}: {count}" for code, count in sorted(result["errors"].items(), key=str))
+    line = f"{name}: {result['rps']:.1f} req/s, {result['requests']} ok, errors {{{errors}}}"
+    if result["requests"]:
+        line += f", p50 {result['p50_ms']:.1f}ms  p95 {result['p95_ms']:.1f}ms  p99 {result['p99_ms']:.1f}ms"
+    return line
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8888")
+    parser.add_argument("--path", default="/v1/guides")
+    parser.add_argument("--method", default="GET")
+    parser.add_argument("--body", help="JSON request body")
+    parser.add_argument("--token", help="Bearer token (otherwise log in with --email/--password)")
+    parser.add_argument("--email", default="admin@snapstep.local")
+    parser.add_argument("--password", default="admin123")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--login-storm", type=int, default=0, help="Extra clients logging in continuously")
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--label", default="", help="Name for this run in the output, e.g. sync or async")
+    args = parser.parse_args()
+
+    token = args.token or login(args.url, args.email, args.password)
+    headers = {"Authorization": f"Bearer {token}"}
+    if args.body:
+        headers["Content-Type"] = "application/json"
+    target = Load(args.url, args.method, args.path, headers, args.body)
+    loads = [(target, args.concurrency)]
+    storm = None
+    if args.login_storm:
+        storm = Load(args.url, "POST", LOGIN_PATH, FORM_HEADERS,
+                     urlencode({"email": args.email, "password": args.password}))
+        loads.append((storm, args.login_storm))
+
+    elapsed = run(loads, args.duration)
+    label = f"[{args.label}] " if args.label else ""
+    print(format_result(f"{label}{args.method} {args.path} x{args.concurrency}", target.summary(elapsed)))
+    if storm is not None:
+        print(format_result(f"{label}POST {LOGIN_PATH} x{args.login_storm}", storm.summary(elapsed)))
@@ -0,0 +1,54 @@
+import hashlib
+from datetime import datetime
+from typing import Optional
+from fastapi import Response
+from sqlalchemy import select
+
+from models import Guide
+from storage import signing_window
+
+# Conditional GET: responses carry a strong ETag built from the rows they are
+# rendered from; a client sending it back in If-None-Match gets an empty 304.
+# Endpoints check the ETag with a cheap query before loading anything else.
+
+# Browsers may store the response but must revalidate before every reuse
+CACHE_CONTROL = "private, no-cache"
+
+def make_etag(*parts) -> str:
+    raw = "|".join(part.isoformat() if isinstance(part, datetime) else str(part) for part in parts)
+    return '"' + hashlib.sha256(raw.encode()).hexdigest()[:32] + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses weak comparison, so W/ prefixes are ignored"""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in [c[2:] if c.startswith("W/") else c for c in candidates]
+
+def set_etag(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+
+def not_modified(etag: str) -> Response:
+    response = Response(status_code=304)
+    set_etag(response, etag)
+    return response
+
+def guide_state_statement(tenant_id: int, guide_id: int):
+    """SELECT (version, updated_at) of one guide: all a guide ETag needs"""
+    return select(Guide.version, Guide.updated_at).where(
+        Guide.id == guide_id,
+        Guide.tenant_id == tenant_id
+    )
+
+def guide_etag(guide_id: int, version: int, updated_at: Optional[datetime], variant: str) -> str:
+    """Guide responses embed signed screenshot URLs, which stay identical only
+    within one URL-signing window, so the window is part of the tag"""
+    return make_etag("guide", guide_id, version, updated_at, variant, signing_window())
+
+def annotations_etag(guide_id: int, version: int, updated_at: Optional[datetime]) -> str:
+    return make_etag("annotations", guide_id, version, updated_at)
+
+def session_etag(session) -> str:
+    """Sessions are small; their tag is built from the fields they are rendered from"""
+    return make_etag("session", session.id, session.title, session.status, session.created_at)
@@ -0,0 +1,130 @@
+import hashlib
+import json
+from dataclasses import dataclass, asdict
+from typing import List, Optional, Tuple
+from sqlalchemy.orm import Session
+
+from models import Guide, Step, Annotation, ExportJob, ExportJobStatus
+
+# Bump when the renderer changes in a way that should invalidate previous exports
+FINGERPRINT_VERSION = 2
+
+@dataclass(frozen=True)
+class ExportProfile:
+    """How screenshots are sized and encoded in an exported document"""
+    name: str
+    dpi: int  # pixels per inch of the embedded screenshots
+    image_format: str  # JPEG, PNG or WEBP
+    quality: Optional[int] = None  # JPEG/WEBP quality, ignored for PNG
+    max_width_in: float = 6.5  # screenshot box on the page; aspect ratio is preserved
+    max_height_in: float = 6.0
+
+    def max_pixels(self) -> Tuple[int, int]:
+        return int(self.max_width_in * self.dpi), int(self.max_height_in * self.dpi)
+
+    def render_params(self) -> dict:
+        return asdict(self)
+
+# JPEG is embedded in PDFs as-is; PNG and WebP are decoded and Flate-compressed
+# by ReportLab, so WebP only pays off for non-PDF outputs.
+EXPORT_PROFILES = {
+    "screen": ExportProfile(name="screen", dpi=110, image_format="JPEG", quality=82),
+    "print": ExportProfile(name="print", dpi=300, image_format="PNG"),
+    "email-small": ExportProfile(name="email-small", dpi=72, image_format="JPEG", quality=60, max_height_in=4.5),
+}
+DEFAULT_EXPORT_PROFILE = "screen"
+
+# Lower runs first. Interactive exports jump ahead of bulk ones.
+EXPORT_PRIORITIES = {
+    "interactive": 0,
+    "bulk": 10,
+}
+
+def get_export_profile(name: Optional[str]) -> ExportProfile:
+    return EXPORT_PROFILES.get(name or DEFAULT_EXPORT_PROFILE, EXPORT_PROFILES[DEFAULT_EXPORT_PROFILE])
+
+def fit_image_box(width_px: int, height_px: int, profile: ExportProfile) -> Tuple[float, float]:
+    """Display size in inches for an image at the profile's DPI, scaled down to
+    fit the profile's box without changing its aspect ratio"""
+    width_in = width_px / profile.dpi
+    height_in = height_px / profile.dpi
+    scale = min(1.0, profile.max_width_in / width_in, profile.max_height_in / height_in)
+    return width_in * scale, height_in * scale
+
+def guide_fingerprint(guide: Guide, steps: List[Step], annotations: List[Annotation], format: str,
+                      profile: str = DEFAULT_EXPORT_PROFILE, collapse_duplicates: bool = False) -> str:
+    """Hash everything that affects an export's output"""
+    payload = {
+        "v": FINGERPRINT_VERSION,
+        "format": format,
+        "profile": get_export_profile(profile).render_params(),
+        "collapse_duplicates": collapse_duplicates,
+        "guide": {
+            "id": guide.id,
+            "title": guide.title,
+            "description": guide.description,
+            "content": guide.content,
+        },
+        "steps": [
+            {
+                "id": step.id,
+                "index": step.index,
+                "title": step.title,
+                "description": step.description,
+                "screenshot_key": step.screenshot_key,
+                "action_type": step.action_type,
+                "action_context": step.action_context,
+                # Only affects output when duplicates are collapsed
+                "duplicate_of_step_id": step.duplicate_of_step_id if collapse_duplicates else None,
+            }
+            for step in sorted(steps, key=lambda s: (s.index, s.id))
+        ],
+        "annotations": [
+            {
+                "id": annotation.id,
+                "step_id": annotation.step_id,
+                "type": annotation.type,
+                "data": annotation.data,
+            }
+            for annotation in sorted(annotations, key=lambda a: a.id)
+        ],
+    }
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+def export_response(job: ExportJob):
+    """ExportResponse for a job, with a download URL once it is completed"""
+    # Imported here: schemas imports this module for the profile constants
+    from schemas import ExportResponse
+    from storage import get_cached_download_url
+    
+    download_url = None
+    if job.status == ExportJobStatus.COMPLETED and job.output_key:
+        download_url = get_cached_download_url(job.output_key, expires_in=3600)
+    
+    return ExportResponse(
+        job_id=job.id,
+        status=job.status,
+        download_url=download_url,
+        profile=job.profile,
+        output_bytes=job.output_bytes,
+        render_ms=job.render_ms
+    )
+
+def find_reusable_export(db: Session, tenant_id: int, fingerprint: str) -> Optional[ExportJob]:
+    """An export with the same fingerprint that is in flight or finished with output.
+    In-flight jobs win so concurrent requests collapse onto one job."""
+    in_flight = db.query(ExportJob).filter(
+        ExportJob.tenant_id == tenant_id,
+        ExportJob.fingerprint == fingerprint,
+        ExportJob.status.in_([ExportJobStatus.PENDING, ExportJobStatus.PROCESSING])
+    ).order_by(ExportJob.id.desc()).first()
+    if in_flight:
+        return in_flight
+
+    return db.query(ExportJob).filter(
+        ExportJob.tenant_id == tenant_id,
+        ExportJob.fingerprint == fingerprint,
+        ExportJob.status == ExportJobStatus.COMPLETED,
+        ExportJob.output_key.isnot(None)
+    ).order_by(ExportJob.id.desc()).first()
@@ -0,0 +1,285 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6380/0")
+JOB_QUEUE_BACKEND = os.getenv("JOB_QUEUE_BACKEND", "redis")  # redis or memory
+JOB_QUEUE_PREFIX = os.getenv("JOB_QUEUE_PREFIX", "snapstep:queue:")
+
+EXPORTS_QUEUE = "exports"  # interactive exports
+EXPORTS_BULK_QUEUE = "exports:bulk"
+DERIVATIVES_QUEUE = "derivatives"  # step ids whose screenshot needs variants
+ASSETS_QUEUE = "assets"  # "tenant_id:key" of uploads to index
+
+# Fair queues (enqueue_fair / try_dequeue_fair): one list per tenant plus a ring
+# of tenants with queued jobs, so consumers take one job per tenant in turn and
+# can skip tenants at their concurrency cap; the backlog stays in the shared
+# queue instead of in one consumer's memory. A tenant is in the ring exactly
+# while its list is non-empty.
+
+# KEYS: tenant list, ring, wake list; ARGV: job id, tenant id
+_FAIR_ENQUEUE = """
+if redis.call('LPUSH', KEYS[1], ARGV[1]) == 1 then
+    redis.call('LPUSH', KEYS[2], ARGV[2])
+end
+redis.call('LPUSH', KEYS[3], '1')
+redis.call('LTRIM', KEYS[3], 0, 63)
+"""
+
+# KEYS: ring; ARGV: tenant list key prefix, then tenant ids to skip
+_FAIR_DEQUEUE = """
+local skip = {}
+for i = 2, #ARGV do skip[ARGV[i]] = true end
+for _ = 1, redis.call('LLEN', KEYS[1]) do
+    local tenant = redis.call('RPOPLPUSH', KEYS[1], KEYS[1])
+    if not skip[tenant] then
+        local key = ARGV[1] .. tenant
+        local job = redis.call('RPOP', key)
+        if redis.call('LLEN', key) == 0 then
+            redis.call('LREM', KEYS[1], 0, tenant)
+        end
+        if job then
+            return {tenant, job}
+        end
+    end
+end
+return nil
+"""
+
+class RedisJobQueue:
+    """Job queue backed by Redis lists. Producers LPUSH, consumers BRPOP."""
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = JOB_QUEUE_PREFIX):
+        import redis
+        self.prefix = prefix
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self._fair_enqueue = self.client.register_script(_FAIR_ENQUEUE)
+        self._fair_dequeue = self.client.register_script(_FAIR_DEQUEUE)
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}{name}"
+
+    def _tenant_prefix(self, name: str) -> str:
+        return f"{self.prefix}{name}:tenant:"
+
+    def _ring_key(self, name: str) -> str:
+        return f"{self.prefix}{name}:tenants"
+
+    def _wake_key(self, name: str) -> str:
+        return f"{self.prefix}{name}:wake"
+
+    def enqueue(self, name: str, job_id) -> None:
+        self.client.lpush(self._key(name), str(job_id))
+
+    def enqueue_many(self, name: str, job_ids: Iterable) -> None:
+        """Push several jobs with one round trip, in order"""
+        job_ids = [str(job_id) for job_id in job_ids]
+        if job_ids:
+            self.client.lpush(self._key(name), *job_ids)
+
+    def dequeue(self, names: Iterable[str], timeout: float = 5) -> Optional[Tuple[str, str]]:
+        """Block until a job is available on any of the queues, in priority order.
+        Returns (queue_name, job_id) or None on timeout."""
+        keys = [self._key(name) for name in names]
+        item = self.client.brpop(keys, timeout=max(1, int(timeout)))
+        if item is None:
+            return None
+        key, job_id = item
+        return key[len(self.prefix):], job_id
+
+    def try_dequeue(self, names: Iterable[str]) -> Optional[Tuple[str, str]]:
+        """Non-blocking dequeue, in priority order"""
+        for name in names:
+            job_id = self.client.rpop(self._key(name))
+            if job_id is not None:
+                return name, job_id
+        return None
+
+    def depth(self, name: str) -> int:
+        return self.client.llen(self._key(name))
+
+    def enqueue_fair(self, name: str, tenant_id: int, job_id) -> None:
+        """Queue a job behind only the same tenant's jobs"""
+        self._fair_enqueue(
+            keys=[self._tenant_prefix(name) + str(tenant_id), self._ring_key(name), self._wake_key(name)],
+            args=[str(job_id), str(tenant_id)]
+        )
+
+    def try_dequeue_fair(self, names: Iterable[str], skip_tenants: Iterable[int] = ()) -> Optional[Tuple[str, int, str]]:
+        """Next job from the fair queues, in priority order, rotating between
+        tenants and skipping `skip_tenants`. Returns (queue_name, tenant_id, job_id)."""
+        skip = [str(tenant_id) for tenant_id in skip_tenants]
+        for name in names:
+            item = self._fair_dequeue(keys=[self._ring_key(name)], args=[self._tenant_prefix(name), *skip])
+            if item:
+                return name, int(item[0]), item[1]
+        return None
+
+    def dequeue_fair(self, names: Iterable[str], skip_tenants: Iterable[int] = (),
+                     timeout: float = 5) -> Optional[Tuple[str, int, str]]:
+        """try_dequeue_fair, waiting up to `timeout` seconds for new jobs"""
+        names, skip_tenants = list(names), list(skip_tenants)
+        deadline = time.monotonic() + timeout
+        while True:
+            item = self.try_dequeue_fair(names, skip_tenants)
+            remaining = deadline - time.monotonic()
+            if item is not None or remaining <= 0:
+                return item
+            # Woken by any enqueue; jobs of skipped tenants just cost a retry
+            self.client.brpop([self._wake_key(name) for name in names], timeout=max(1, int(remaining)))
+
+    def fair_depth(self, name: str) -> int:
+        tenants = self.client.lrange(self._ring_key(name), 0, -1)
+        if not tenants:
+            return 0
+        pipe = self.client.pipeline()
+        for tenant in tenants:
+            pipe.llen(self._tenant_prefix(name) + tenant)
+        return sum(pipe.execute())
+
+class InMemoryJobQueue:
+    """In-process queue with the same interface as RedisJobQueue, for tests
+    and single-process development without a Redis server."""
+
+    def __init__(self):
+        self._queues: Dict[str, deque] = {}
+        self._fair: Dict[str, Tuple[deque, Dict[int, deque]]] = {}  # name -> (tenant ring, tenant -> jobs)
+        self._cond = threading.Condition()
+
+    def enqueue(self, name: str, job_id) -> None:
+        with self._cond:
+            self._queues.setdefault(name, deque()).appendleft(str(job_id))
+            self._cond.notify_all()
+
+    def enqueue_many(self, name: str, job_ids: Iterable) -> None:
+        with self._cond:
+            queue = self._queues.setdefault(name, deque())
+            for job_id in job_ids:
+                queue.appendleft(str(job_id))
+            self._cond.notify_all()
+
+    def dequeue(self, names: Iterable[str], timeout: float = 5) -> Optional[Tuple[str, str]]:
+        names = list(names)
+        with self._cond:
+            found = self._cond.wait_for(lambda: self._pop(names, peek=True), timeout=timeout)
+            if not found:
+                return None
+            return self._pop(names)
+
+    def try_dequeue(self, names: Iterable[str]) -> Optional[Tuple[str, str]]:
+        with self._cond:
+            return self._pop(list(names))
+
+    def _pop(self, names, peek: bool = False):
+        for name in names:
+            queue = self._queues.get(name)
+            if queue:
+                return True if peek else (name, queue.pop())
+        return None
+
+    def depth(self, name: str) -> int:
+        with self._cond:
+            return len(self._queues.get(name, ()))
+
+    def enqueue_fair(self, name: str, tenant_id: int, job_id) -> None:
+        with self._cond:
+            ring, jobs = self._fair.setdefault(name, (deque(), {}))
+            if tenant_id not in jobs:
+                jobs[tenant_id] = deque()
+                ring.appendleft(tenant_id)
+            jobs[tenant_id].appendleft(str(job_id))
+            self._cond.notify_all()
+
+    def try_dequeue_fair(self, names: Iterable[str], skip_tenants: Iterable[int] = ()) -> Optional[Tuple[str, int, str]]:
+        with self._cond:
+            return self._pop_fair(list(names), set(skip_tenants))
+
+    def dequeue_fair(self, names: Iterable[str], skip_tenants: Iterable[int] = (),
+                     timeout: float = 5) -> Optional[Tuple[str, int, str]]:
+        names, skip = list(names), set(skip_tenants)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                item = self._pop_fair(names, skip)
+                remaining = deadline - time.monotonic()
+                if item is not None or remaining <= 0:
+                    return item
+                self._cond.wait(remaining)
+
+    def _pop_fair(self, names, skip):
+        for name in names:
+            ring, jobs = self._fair.get(name, (deque(), {}))
+            for _ in range(len(ring)):
+                tenant_id = ring.pop()
+                ring.appendleft(tenant_id)
+                if tenant_id in skip:
+                    continue
+                job_id = jobs[tenant_id].pop()
+                if not jobs[tenant_id]:
+                    del jobs[tenant_id]
+                    ring.remove(tenant_id)
+                return name, tenant_id, job_id
+        return None
+
+    def fair_depth(self, name: str) -> int:
+        with self._cond:
+            return sum(len(jobs) for jobs in self._fair.get(name, (deque(), {}))[1].values())
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+def get_job_queue():
+    """Return the process-wide job queue, creating it on first use"""
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                if JOB_QUEUE_BACKEND == "memory":
+                    _job_queue = InMemoryJobQueue()
+                else:
+                    _job_queue = RedisJobQueue()
+    return _job_queue
+
+def export_payload(job_id: int, tenant_id: int) -> str:
+    """Entry of the legacy single-list export queues (exports now use the fair
+    queues); workers still drain these during rollouts"""
+    return f"{tenant_id}:{job_id}"
+
+def parse_export_payload(payload: str) -> Tuple[int, Optional[int]]:
+    """Returns (job_id, tenant_id); tenant_id is None for bare job ids"""
+    tenant_id, _, job_id = payload.rpartition(":")
+    return int(job_id), int(tenant_id) if tenant_id else None
+
+def enqueue_job(name: str, job_id) -> bool:
+    """Push a job id onto a queue. Returns False if the queue is unreachable;
+    the worker's database sweep picks up anything that was not enqueued."""
+    try:
+        get_job_queue().enqueue(name, job_id)
+        return True
+    except Exception as e:
+        print(f"Error enqueueing {name} job {job_id}: {e}")
+        return False
+
+def enqueue_fair_job(name: str, tenant_id: int, job_id) -> bool:
+    """enqueue_job onto a fair (per-tenant) queue"""
+    try:
+        get_job_queue().enqueue_fair(name, tenant_id, job_id)
+        return True
+    except Exception as e:
+        print(f"Error enqueueing {name} job {job_id} for tenant {tenant_id}: {e}")
+        return False
+
+def enqueue_jobs(name: str, job_ids) -> bool:
+    """enqueue_job for several ids at once"""
+    job_ids = list(job_ids)
+    try:
+        get_job_queue().enqueue_many(name, job_ids)
+        return True
+    except Exception as e:
+        print(f"Error enqueueing {len(job_ids)} {name} jobs: {e}")
+        return False
@@ -1,27 +1,46 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Query, Form
+from fastapi import FastAPI, Depends, HTTPException, status, Query, Form, Header, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Session, selectinload
 from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 import os
 from datetime import datetime
 import secrets
 from typing import List, Optional
 
-from database import SessionLocal, engine, Base, get_db
+from database import SessionLocal, engine, Base, get_db, count_queries, DATABASE_ASYNC, DATABASE_REPLICA_URLS
+from read_routing import get_read_db, read_your_writes
 from models import (
-    User, Tenant, Session, Guide, Step, Annotation, ExportJob,
-    SessionStatus, GuideStatus, ExportJobStatus
+    User, Tenant, Session, Guide, Step, Annotation, ExportJob, ScreenshotAsset,
+    SessionStatus, GuideStatus, ExportJobStatus, guide_recent_at, bump_guide_version
 )
 from schemas import (
-    SessionCreate, SessionResponse, StepCreate, StepResponse,
-    GuideResponse, GuideUpdate, AnnotationCreate, AnnotationResponse,
-    ExportRequest, ExportResponse, UserCreate, UserResponse, UserUpdate, Token
+    SessionCreate, SessionResponse, StepCreate, StepResponse, StepBatchCreate, StepBatchResponse,
+    GuideResponse, GuideSummary, GuideUpdate, AnnotationCreate, AnnotationResponse,
+    ExportRequest, ExportResponse, UserCreate, UserResponse, UserUpdate, Token,
+    UploadFinalize, UploadBatchRequest, UploadBatchResponse, UploadTicket, ScreenshotAssetResponse, UsageResponse
 )
-from storage import get_presigned_upload_url, get_presigned_download_url
+from storage import (
+    get_presigned_upload_url, get_presigned_upload_post, new_upload_key, ensure_bucket_exists,
+    upload_headers, content_address, stored_checksum_matches, delete_object, owned_by_tenant
+)
+from botocore.exceptions import ClientError
+from job_queue import (
+    enqueue_job, enqueue_jobs, enqueue_fair_job, EXPORTS_QUEUE, EXPORTS_BULK_QUEUE, DERIVATIVES_QUEUE, ASSETS_QUEUE
+)
+from pagination import keyset_page, set_next_cursor
+from conditional import (
+    etag_matches, set_etag, not_modified, guide_state_statement, guide_etag, annotations_etag, session_etag
+)
+from steps import attach_screenshot_urls, find_step_by_idempotency_key, batch_step_rows, batch_insert_statement, check_screenshot_keys
+from exports import guide_fingerprint, find_reusable_export, export_response, EXPORT_PRIORITIES
 from auth import (
     get_current_user, get_current_admin, create_access_token, verify_password,
-    get_password_hash, decode_token
+    get_password_hash, decode_token, PasswordWorkOverloaded
 )
+from principal_cache import principal_cache
+from metrics import registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
 
 # Create tables
 Base.metadata.create_all(bind=engine)
@@ -35,8 +54,47 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-DB-Query-Count", "X-Next-Cursor", "ETag"],
 )
 
+# Per-request SQL statement count, to spot N+1 queries during development
+SQL_QUERY_COUNT_HEADER = os.getenv("SQL_QUERY_COUNT_HEADER", "false").lower() == "true"
+SQL_QUERY_BUDGET = int(os.getenv("SQL_QUERY_BUDGET", "0"))  # warn above this many; 0 disables
+
+if SQL_QUERY_COUNT_HEADER or SQL_QUERY_BUDGET:
+    @app.middleware("http")
+    async def count_request_queries(request: Request, call_next):
+        with count_queries() as counter:
+            response = await call_next(request)
+        if SQL_QUERY_COUNT_HEADER:
+            response.headers["X-DB-Query-Count"] = str(counter.count)
+        if SQL_QUERY_BUDGET and counter.count > SQL_QUERY_BUDGET:
+            print(f"Warning: {request.method} {request.url.path} ran {counter.count} SQL queries "
+                  f"(budget {SQL_QUERY_BUDGET})")
+        return response
+
+@app.exception_handler(PasswordWorkOverloaded)
+async def password_work_overloaded(request: Request, exc: PasswordWorkOverloaded):
+    # Shed load fast instead of queueing logins behind seconds of bcrypt work
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Too many password operations in progress, retry shortly"},
+        headers={"Retry-After": "1"}
+    )
+
+if DATABASE_REPLICA_URLS:
+    @app.middleware("http")
+    async def stick_to_primary_after_writes(request: Request, call_next):
+        # Reads right after a write go to the primary, so clients see their own changes
+        response = await call_next(request)
+        if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+            until = read_your_writes.mark_write(request)
+            response.set_cookie(
+                read_your_writes.COOKIE, f"{until:.3f}",
+                max_age=int(read_your_writes.seconds) + 1, httponly=True, samesite="lax"
+            )
+        return response
+
 # Initialize default tenant and admin user if needed
 def init_default_tenant():
     db = SessionLocal()
@@ -99,16 +157,29 @@ def init_default_admin():
     finally:
         db.close()
 
+def init_storage():
+    # Checked once here instead of on every upload; retried on first use if S3 is down
+    try:
+        ensure_bucket_exists()
+    except Exception as e:
+        print(f"Error checking storage bucket: {e}")
+
 init_default_tenant()
 init_default_admin()
+init_storage()
 
 @app.get("/health")
 async def health():
     return {"status": "ok", "service": "snapstep-api"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics for this API process (signed URL and principal caches)"""
+    return Response(content=registry.render(), media_type=METRICS_CONTENT_TYPE)
+
 # Auth endpoints
 @app.post("/v1/auth/register", response_model=UserResponse)
-async def register(
+def register(
     user_data: UserCreate,
     db: Session = Depends(get_db)
 ):
@@ -141,7 +212,7 @@ async def register(
     return user
 
 @app.post("/v1/auth/login", response_model=Token)
-async def login(
+def login(
     email: str = Form(...),
     password: str = Form(...),
     db: Session = Depends(get_db)
@@ -161,12 +232,12 @@ async def login(
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/v1/auth/me", response_model=UserResponse)
-async def get_me(current_user: User = Depends(get_current_user)):
+def get_me(current_user: User = Depends(get_current_user)):
     return current_user
 
 # Session endpoints
 @app.post("/v1/sessions", response_model=SessionResponse)
-async def create_session(
+def create_session(
     session_data: SessionCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -192,9 +263,11 @@ async def create_session(
     )
 
 @app.get("/v1/sessions/{session_id}", response_model=SessionResponse)
-async def get_session(
+def get_session(
     session_id: int,
-    db: Session = Depends(get_db),
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get a session by ID"""
@@ -206,32 +279,159 @@ async def get_session(
     if not db_session:
         raise HTTPException(status_code=404, detail="Session not found")
     
+    etag = session_etag(db_session)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+    
     return db_session
 
 @app.post("/v1/uploads")
-async def get_presigned_url(
+def get_presigned_url(
     filename: str,
     content_type: str = "image/png",
+    sha256: Optional[str] = Query(None, pattern="^[0-9a-fA-F]{64}$"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get presigned URL for uploading screenshot"""
+    """Get presigned URL for uploading screenshot. Clients that send the SHA-256
+    of the file get a content-addressed key; if the tenant already stored those
+    bytes, the existing key is returned and no upload is needed. Otherwise the
+    PUT must carry `upload_headers`, which bind the URL to those bytes."""
+    if sha256:
+        existing = db.query(ScreenshotAsset).filter(
+            ScreenshotAsset.tenant_id == current_user.tenant_id,
+            ScreenshotAsset.sha256 == sha256.lower()
+        ).order_by(ScreenshotAsset.id).first()
+        if existing:
+            return {
+                "upload_url": None,
+                "key": existing.key,
+                "exists": True,
+                "expires_in": 0
+            }
     try:
         upload_url, key = get_presigned_upload_url(
             filename=filename,
             content_type=content_type,
-            tenant_id=current_user.tenant_id
+            tenant_id=current_user.tenant_id,
+            sha256=sha256
         )
         return {
             "upload_url": upload_url,
+            "upload_headers": upload_headers(content_type, sha256),
             "key": key,
+            "exists": False,
             "expires_in": 3600
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/v1/uploads:batch", response_model=UploadBatchResponse)
+def get_presigned_urls_batch(
+    batch: UploadBatchRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Issue upload URLs (method=put) or POST policies (method=post) for many
+    screenshots at once. Files whose SHA-256 the tenant already stored come back
+    with exists=true and their existing key."""
+    hashes = {item.sha256.lower() for item in batch.files if item.sha256}
+    existing = {}
+    if hashes:
+        for sha256, key in db.query(ScreenshotAsset.sha256, ScreenshotAsset.key).filter(
+            ScreenshotAsset.tenant_id == current_user.tenant_id,
+            ScreenshotAsset.sha256.in_(hashes)
+        ).order_by(ScreenshotAsset.id.desc()).all():
+            existing[sha256] = key  # oldest asset wins
+    
+    uploads = []
+    try:
+        for item in batch.files:
+            sha256 = item.sha256.lower() if item.sha256 else None
+            if sha256 in existing:
+                uploads.append(UploadTicket(key=existing[sha256], exists=True))
+                continue
+            if batch.method == "post":
+                key = new_upload_key(item.filename, current_user.tenant_id, sha256)
+                policy = get_presigned_upload_post(key, item.content_type, sha256=sha256)
+                uploads.append(UploadTicket(key=key, upload_url=policy["url"], fields=policy["fields"], expires_in=3600))
+            else:
+                upload_url, key = get_presigned_upload_url(
+                    filename=item.filename,
+                    content_type=item.content_type,
+                    tenant_id=current_user.tenant_id,
+                    sha256=sha256
+                )
+                uploads.append(UploadTicket(
+                    key=key, upload_url=upload_url, headers=upload_headers(item.content_type, sha256), expires_in=3600
+                ))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    return UploadBatchResponse(uploads=uploads)
+
+@app.post("/v1/uploads/finalize", status_code=202)
+def finalize_upload(
+    upload: UploadFinalize,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Mark an upload as complete so the worker records its metadata
+    (dimensions, size, MIME type, SHA-256). Content-addressed uploads whose bytes
+    do not match their key are deleted and rejected, here if S3 already knows the
+    checksum, otherwise by the worker (no metadata is ever recorded for them)."""
+    if not owned_by_tenant(upload.key, current_user.tenant_id):
+        raise HTTPException(status_code=404, detail="Upload not found")
+    
+    asset = db.query(ScreenshotAsset).filter(ScreenshotAsset.key == upload.key).first()
+    if asset:
+        return {"key": upload.key, "status": "recorded"}
+    
+    if content_address(upload.key):
+        try:
+            matches = stored_checksum_matches(upload.key)
+        except ClientError:
+            raise HTTPException(status_code=404, detail="Upload not found")
+        if matches is False:
+            delete_object(upload.key)
+            raise HTTPException(status_code=422, detail="Uploaded content does not match its SHA-256")
+    
+    enqueue_job(ASSETS_QUEUE, f"{current_user.tenant_id}:{upload.key}")
+    return {"key": upload.key, "status": "queued"}
+
+@app.get("/v1/uploads/metadata", response_model=ScreenshotAssetResponse)
+def get_upload_metadata(
+    key: str,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get recorded metadata for an uploaded screenshot"""
+    asset = db.query(ScreenshotAsset).filter(
+        ScreenshotAsset.key == key,
+        ScreenshotAsset.tenant_id == current_user.tenant_id
+    ).first()
+    
+    if not asset:
+        raise HTTPException(status_code=404, detail="Metadata not recorded yet")
+    
+    return asset
+
+@app.get("/v1/usage", response_model=UsageResponse)
+def get_usage(
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Screenshot storage used by the current tenant, from recorded metadata"""
+    count, total = db.query(
+        func.count(ScreenshotAsset.id),
+        func.coalesce(func.sum(ScreenshotAsset.byte_size), 0)
+    ).filter(ScreenshotAsset.tenant_id == current_user.tenant_id).one()
+    
+    return UsageResponse(screenshot_count=count, screenshot_bytes=total)
+
 @app.post("/v1/steps", response_model=StepResponse)
-async def create_step(
+def create_step(
     step_data: StepCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -245,6 +445,12 @@ async def create_step(
     
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
+    check_screenshot_keys(current_user.tenant_id, [step_data])
+    
+    if step_data.idempotency_key:
+        existing = find_step_by_idempotency_key(db, current_user.tenant_id, step_data.idempotency_key)
+        if existing:
+            return existing
     
     step = Step(
         tenant_id=current_user.tenant_id,
@@ -254,16 +460,66 @@ async def create_step(
         description=step_data.description,
         screenshot_key=step_data.screenshot_key,
         action_type=step_data.action_type,
-        action_context=step_data.action_context
+        action_context=step_data.action_context,
+        idempotency_key=step_data.idempotency_key
     )
     db.add(step)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent retry with the same idempotency key won
+        db.rollback()
+        existing = find_step_by_idempotency_key(db, current_user.tenant_id, step_data.idempotency_key)
+        if existing:
+            return existing
+        raise
     db.refresh(step)
     
+    enqueue_job(DERIVATIVES_QUEUE, step.id)
+    
     return step
 
+@app.post("/v1/sessions/{session_id}/steps:batch", response_model=StepBatchResponse)
+def create_steps_batch(
+    session_id: int,
+    batch: StepBatchCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Append many steps to a session in one transaction. Steps whose
+    idempotency_key was already used (a retried batch) are not inserted again;
+    their existing ids are returned in place."""
+    session = db.query(Session.id).filter(
+        Session.id == session_id,
+        Session.tenant_id == current_user.tenant_id
+    ).first()
+    
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    check_screenshot_keys(current_user.tenant_id, batch.steps)
+    
+    rows = batch_step_rows(current_user.tenant_id, session_id, batch.steps)
+    keys = [row["idempotency_key"] for row in rows]
+    
+    created = dict(db.execute(batch_insert_statement(rows)).all())
+    ids_by_key = {key: step_id for step_id, key in created.items()}
+    
+    missing = [key for key in set(keys) if key not in ids_by_key]
+    if missing:
+        ids_by_key.update(
+            (key, step_id) for step_id, key in db.query(Step.id, Step.idempotency_key).filter(
+                Step.tenant_id == current_user.tenant_id,
+                Step.idempotency_key.in_(missing)
+            ).all()
+        )
+    db.commit()
+    
+    enqueue_jobs(DERIVATIVES_QUEUE, sorted(created))
+    
+    return StepBatchResponse(step_ids=[ids_by_key[key] for key in keys], created=len(created))
+
 @app.post("/v1/sessions/{session_id}/complete", response_model=GuideResponse)
-async def complete_session(
+def complete_session(
     session_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -319,28 +575,74 @@ async def complete_session(
     return guide
 
 # Guide endpoints
-@app.get("/v1/guides", response_model=List[GuideResponse])
-async def list_guides(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
+@app.get("/v1/guides", response_model=List[GuideSummary])
+def list_guides(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    sort: str = Query("updated", pattern="^(updated|id)$"),
+    status: Optional[GuideStatus] = None,
+    owner_id: Optional[int] = None,
+    skip: int = Query(0, ge=0),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
-    """List all guides for the current user's tenant"""
-    guides = db.query(Guide).filter(
-        Guide.tenant_id == current_user.tenant_id
-    ).offset(skip).limit(limit).all()
-    
-    return guides
+    """List guides for the current user's tenant, without steps or content.
+    Sorted by most recently updated (sort=updated) or by id. Pass the
+    X-Next-Cursor response header back as `cursor` for the next page; `skip`
+    (offset paging) is still accepted for older clients."""
+    if cursor and skip:
+        raise HTTPException(status_code=400, detail="Use either cursor or skip, not both")
+    
+    step_count = db.query(func.count(Step.id)).filter(
+        Step.guide_id == Guide.id
+    ).correlate(Guide).scalar_subquery().label("step_count")
+    recent_at = guide_recent_at.label("recent_at")
+    query = db.query(
+        Guide.id, Guide.tenant_id, Guide.owner_id, Guide.session_id, Guide.title,
+        Guide.description, Guide.status, Guide.share_token, Guide.created_at, Guide.updated_at,
+        recent_at, step_count
+    ).filter(Guide.tenant_id == current_user.tenant_id)
+    if status is not None:
+        query = query.filter(Guide.status == status)
+    if owner_id is not None:
+        query = query.filter(Guide.owner_id == owner_id)
+    
+    if sort == "updated":
+        keys, types, descending = [recent_at, Guide.id], [datetime, int], True
+    else:
+        keys, types, descending = [Guide.id], [int], False
+    
+    if skip:
+        order = [key.desc() if descending else key.asc() for key in keys]
+        rows = query.order_by(*order).offset(skip).limit(limit).all()
+    else:
+        rows, next_cursor = keyset_page(query, sort, keys, types, cursor, limit, descending)
+        set_next_cursor(response, next_cursor)
+    
+    return [GuideSummary.model_validate(row) for row in rows]
 
 @app.get("/v1/guides/{guide_id}", response_model=GuideResponse)
-async def get_guide(
+def get_guide(
     guide_id: int,
-    db: Session = Depends(get_db),
+    response: Response,
+    variant: str = Query("preview", pattern="^(thumbnail|preview|print|original)$"),
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get a guide by ID"""
-    guide = db.query(Guide).filter(
+    """Get a guide by ID. Screenshot URLs point at the requested variant.
+    Answers 304 without loading steps when If-None-Match has the current ETag."""
+    state = db.execute(guide_state_statement(current_user.tenant_id, guide_id)).first()
+    
+    if not state:
+        raise HTTPException(status_code=404, detail="Guide not found")
+    
+    etag = guide_etag(guide_id, state.version, state.updated_at, variant)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    
+    guide = db.query(Guide).options(selectinload(Guide.steps)).filter(
         Guide.id == guide_id,
         Guide.tenant_id == current_user.tenant_id
     ).first()
@@ -349,14 +651,14 @@ async def get_guide(
         raise HTTPException(status_code=404, detail="Guide not found")
     
     # Get screenshot URLs for steps
-    for step in guide.steps:
-        if step.screenshot_key:
-            step.screenshot_url = get_presigned_download_url(step.screenshot_key, expires_in=3600)
+    attach_screenshot_urls(guide.steps, variant)
+    # Tag what was actually loaded, in case the guide changed since the check
+    set_etag(response, guide_etag(guide.id, guide.version, guide.updated_at, variant))
     
     return guide
 
 @app.patch("/v1/guides/{guide_id}", response_model=GuideResponse)
-async def update_guide(
+def update_guide(
     guide_id: int,
     guide_update: GuideUpdate,
     db: Session = Depends(get_db),
@@ -381,6 +683,7 @@ async def update_guide(
         guide.status = guide_update.status
     
     guide.updated_at = datetime.utcnow()
+    guide.version = Guide.version + 1
     db.commit()
     db.refresh(guide)
     
@@ -388,7 +691,7 @@ async def update_guide(
 
 # Annotation endpoints
 @app.post("/v1/annotations", response_model=AnnotationResponse)
-async def create_annotation(
+def create_annotation(
     annotation_data: AnnotationCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -411,19 +714,31 @@ async def create_annotation(
         data=annotation_data.data
     )
     db.add(annotation)
+    bump_guide_version(db, guide.id)
     db.commit()
     db.refresh(annotation)
     
     return annotation
 
 @app.get("/v1/guides/{guide_id}/annotations", response_model=List[AnnotationResponse])
-async def get_annotations(
+def get_annotations(
     guide_id: int,
-    db: Session = Depends(get_db),
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get all annotations for a guide"""
-    guide = db.query(Guide).filter(
+    """Get all annotations for a guide (304 if If-None-Match has the current ETag)"""
+    state = db.execute(guide_state_statement(current_user.tenant_id, guide_id)).first()
+    
+    if not state:
+        raise HTTPException(status_code=404, detail="Guide not found")
+    
+    etag = annotations_etag(guide_id, state.version, state.updated_at)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    
+    guide = db.query(Guide).options(selectinload(Guide.annotations)).filter(
         Guide.id == guide_id,
         Guide.tenant_id == current_user.tenant_id
     ).first()
@@ -431,10 +746,12 @@ async def get_annotations(
     if not guide:
         raise HTTPException(status_code=404, detail="Guide not found")
     
+    set_etag(response, annotations_etag(guide.id, guide.version, guide.updated_at))
+    
     return guide.annotations
 
 @app.delete("/v1/annotations/{annotation_id}")
-async def delete_annotation(
+def delete_annotation(
     annotation_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -449,13 +766,14 @@ async def delete_annotation(
         raise HTTPException(status_code=404, detail="Annotation not found")
     
     db.delete(annotation)
+    bump_guide_version(db, annotation.guide_id)
     db.commit()
     
     return {"message": "Annotation deleted"}
 
 # Export endpoints
 @app.post("/v1/exports/pdf", response_model=ExportResponse)
-async def request_pdf_export(
+def request_pdf_export(
     export_request: ExportRequest,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -469,30 +787,49 @@ async def request_pdf_export(
     if not guide:
         raise HTTPException(status_code=404, detail="Guide not found")
     
+    # Reuse an identical export that is finished or already in flight
+    steps = db.query(Step).filter(Step.guide_id == guide.id).all()
+    annotations = db.query(Annotation).filter(Annotation.guide_id == guide.id).all()
+    fingerprint = guide_fingerprint(guide, steps, annotations, export_request.format, export_request.profile,
+                                    export_request.collapse_duplicates)
+    
+    existing = find_reusable_export(db, current_user.tenant_id, fingerprint)
+    if existing:
+        return export_response(existing)
+    
     # Create export job
     job = ExportJob(
         tenant_id=current_user.tenant_id,
         guide_id=export_request.guide_id,
         status=ExportJobStatus.PENDING,
-        format=export_request.format
+        format=export_request.format,
+        profile=export_request.profile,
+        priority=EXPORT_PRIORITIES[export_request.priority],
+        collapse_duplicates=export_request.collapse_duplicates,
+        fingerprint=fingerprint
     )
     db.add(job)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent request created the in-flight job first
+        db.rollback()
+        existing = find_reusable_export(db, current_user.tenant_id, fingerprint)
+        if existing:
+            return export_response(existing)
+        raise HTTPException(status_code=409, detail="Export already in progress")
     db.refresh(job)
     
-    # TODO: Queue job in Redis for worker to process
-    # For now, return pending status
+    # Wake a worker immediately; the worker's DB sweep is the fallback
+    queue_name = EXPORTS_BULK_QUEUE if export_request.priority == "bulk" else EXPORTS_QUEUE
+    enqueue_fair_job(queue_name, job.tenant_id, job.id)
     
-    return ExportResponse(
-        job_id=job.id,
-        status=job.status,
-        download_url=None
-    )
+    return export_response(job)
 
 @app.get("/v1/exports/{job_id}", response_model=ExportResponse)
-async def get_export_status(
+def get_export_status(
     job_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get export job status"""
@@ -504,30 +841,39 @@ async def get_export_status(
     if not job:
         raise HTTPException(status_code=404, detail="Export job not found")
     
-    download_url = None
-    if job.status == ExportJobStatus.COMPLETED and job.output_key:
-        download_url = get_presigned_download_url(job.output_key, expires_in=3600)
-    
-    return ExportResponse(
-        job_id=job.id,
-        status=job.status,
-        download_url=download_url
-    )
+    return export_response(job)
 
 # Admin endpoints
 @app.get("/admin/users", response_model=List[UserResponse])
-async def list_all_users(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
+def list_all_users(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    tenant_id: Optional[int] = None,
+    is_active: Optional[bool] = None,
+    skip: int = Query(0, ge=0),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_admin)
 ):
-    """List all users (admin only)"""
-    users = db.query(User).offset(skip).limit(limit).all()
+    """List all users by id (admin only). Cursor paging via X-Next-Cursor like
+    /v1/guides; `skip` is still accepted."""
+    if cursor and skip:
+        raise HTTPException(status_code=400, detail="Use either cursor or skip, not both")
+    
+    query = db.query(User)
+    if tenant_id is not None:
+        query = query.filter(User.tenant_id == tenant_id)
+    if is_active is not None:
+        query = query.filter(User.is_active == is_active)
+    
+    if skip:
+        return query.order_by(User.id).offset(skip).limit(limit).all()
+    users, next_cursor = keyset_page(query, "id", [User.id], [int], cursor, limit)
+    set_next_cursor(response, next_cursor)
     return users
 
 @app.post("/admin/users", response_model=UserResponse)
-async def create_user(
+def create_user(
     user_data: UserCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_admin)
@@ -561,9 +907,9 @@ async def create_user(
     return user
 
 @app.get("/admin/users/{user_id}", response_model=UserResponse)
-async def get_user(
+def get_user(
     user_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_admin)
 ):
     """Get a user by ID (admin only)"""
@@ -573,7 +919,7 @@ async def get_user(
     return user
 
 @app.patch("/admin/users/{user_id}", response_model=UserResponse)
-async def update_user(
+def update_user(
     user_id: int,
     user_update: UserUpdate,
     db: Session = Depends(get_db),
@@ -583,6 +929,7 @@ async def update_user(
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    old_email = user.email
     
     # Prevent admin from removing their own admin status
     if user_id == current_user.id and user_update.is_admin == False:
@@ -613,11 +960,12 @@ async def update_user(
     user.updated_at = datetime.utcnow()
     db.commit()
     db.refresh(user)
+    principal_cache.invalidate(old_email, user.email)
     
     return user
 
 @app.delete("/admin/users/{user_id}")
-async def delete_user(
+def delete_user(
     user_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_admin)
@@ -633,9 +981,15 @@ async def delete_user(
     
     db.delete(user)
     db.commit()
+    principal_cache.invalidate(user.email)
     
     return {"message": "User deleted successfully"}
 
+# Hot endpoints on the asyncpg engine, in place of the sync versions above
+if DATABASE_ASYNC:
+    import async_routes
+    async_routes.install(app)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8888)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, JSON, Enum as SQLEnum
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, ForeignKey, Boolean, JSON, Index, text, Enum as SQLEnum
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -36,6 +36,10 @@ class User(Base):
     tenant = relationship("Tenant", back_populates="users")
     sessions = relationship("Session", back_populates="user")
     guides = relationship("Guide", back_populates="owner")
+    
+    __table_args__ = (
+        Index("ix_users_tenant_id", "tenant_id", "id"),  # admin user list filtered by tenant
+    )
 
 class Tenant(Base):
     __tablename__ = "tenants"
@@ -77,6 +81,7 @@ class Guide(Base):
     content = Column(JSON, nullable=True)  # TipTap document structure
     status = Column(SQLEnum(GuideStatus), default=GuideStatus.DRAFT)
     share_token = Column(String, unique=True, index=True, nullable=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # bumped by any change to the guide, its steps or annotations (ETags)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -87,6 +92,22 @@ class Guide(Base):
     annotations = relationship("Annotation", back_populates="guide")
     export_jobs = relationship("ExportJob", back_populates="guide")
 
+# Sort key for "recently updated" guide lists; updated_at is only set on change
+guide_recent_at = func.coalesce(Guide.updated_at, Guide.created_at)
+
+def bump_guide_version(db, guide_id: int):
+    """Invalidate a guide's ETags after changing it or anything rendered with it.
+    A single UPDATE, so concurrent bumps are never lost; commits with the caller."""
+    db.query(Guide).filter(Guide.id == guide_id).update(
+        {Guide.version: Guide.version + 1}, synchronize_session=False
+    )
+
+# Keyset pagination of guide lists (see pagination.py), optionally filtered by status or owner
+Index("ix_guides_tenant_recent", Guide.tenant_id, guide_recent_at, Guide.id)
+Index("ix_guides_tenant_status_recent", Guide.tenant_id, Guide.status, guide_recent_at, Guide.id)
+Index("ix_guides_tenant_owner_recent", Guide.tenant_id, Guide.owner_id, guide_recent_at, Guide.id)
+Index("ix_guides_tenant_id", Guide.tenant_id, Guide.id)
+
 class Step(Base):
     __tablename__ = "steps"
     
@@ -98,13 +119,23 @@ class Step(Base):
     title = Column(String, nullable=True)
     description = Column(Text, nullable=True)
     screenshot_key = Column(String, nullable=True)  # S3 key
+    thumbnail_key = Column(String, nullable=True)  # derivatives generated by the worker
+    preview_key = Column(String, nullable=True)
+    print_key = Column(String, nullable=True)
+    duplicate_of_step_id = Column(Integer, ForeignKey("steps.id", ondelete="SET NULL"), nullable=True)  # near-identical earlier frame
     action_type = Column(String, nullable=True)  # click, type, select, etc.
     action_context = Column(JSON, nullable=True)  # UI element info, app name, etc.
+    idempotency_key = Column(String(128), nullable=True)  # client retry key, unique per tenant
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     tenant_id_fk = relationship("Tenant")
     session = relationship("Session", back_populates="steps")
     guide = relationship("Guide", back_populates="steps")
+    
+    __table_args__ = (
+        Index("ix_steps_guide_index", "guide_id", "index"),  # guide step loads and step counts
+        Index("uq_steps_tenant_idempotency_key", "tenant_id", "idempotency_key", unique=True),
+    )
 
 class Annotation(Base):
     __tablename__ = "annotations"
@@ -119,6 +150,21 @@ class Annotation(Base):
     
     guide = relationship("Guide", back_populates="annotations")
 
+class ScreenshotAsset(Base):
+    """What we know about an uploaded screenshot without downloading it"""
+    __tablename__ = "screenshot_assets"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=False, index=True)
+    key = Column(String, unique=True, index=True, nullable=False)  # S3 key of the original
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    byte_size = Column(BigInteger, nullable=False)
+    mime_type = Column(String, nullable=True)
+    sha256 = Column(String(64), index=True, nullable=False)
+    phash = Column(String(16), nullable=True)  # 64-bit difference hash, hex
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
 class ExportJob(Base):
     __tablename__ = "export_jobs"
     
@@ -127,11 +173,31 @@ class ExportJob(Base):
     guide_id = Column(Integer, ForeignKey("guides.id"), nullable=False)
     status = Column(SQLEnum(ExportJobStatus), default=ExportJobStatus.PENDING)
     format = Column(String, default="pdf")
+    profile = Column(String, default="screen")  # key into exports.EXPORT_PROFILES
+    priority = Column(Integer, default=0, nullable=False)  # lower runs first, see exports.EXPORT_PRIORITIES
+    collapse_duplicates = Column(Boolean, default=False, nullable=False)  # skip screenshots flagged as near-duplicates
     output_key = Column(String, nullable=True)  # S3 key for generated file
+    fingerprint = Column(String, nullable=True, index=True)  # hash of the guide content exported
     error_message = Column(Text, nullable=True)
+    worker_id = Column(String, nullable=True)  # hostname:pid of the worker holding the lease
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True, index=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    output_bytes = Column(Integer, nullable=True)
+    render_ms = Column(Integer, nullable=True)
+    stats = Column(JSON, nullable=True)  # per-job measurements recorded by the worker
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     completed_at = Column(DateTime(timezone=True), nullable=True)
     
     guide = relationship("Guide", back_populates="export_jobs")
+    
+    __table_args__ = (
+        # At most one in-flight job per fingerprint; concurrent requests merge onto it
+        Index(
+            "uq_export_jobs_inflight_fingerprint", "tenant_id", "fingerprint",
+            unique=True,
+            postgresql_where=text("status IN ('PENDING', 'PROCESSING')")
+        ),
+    )
 
 
@@ -0,0 +1,53 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+from fastapi import HTTPException, Response
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Keyset pagination: the client passes back the sort key of the last row it saw
+# instead of an offset, so deep pages cost the same as the first and rows
+# inserted meanwhile do not shift pages. Cursors are opaque to clients.
+
+def encode_cursor(sort: str, values: Sequence[Any]) -> str:
+    encoded = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    payload = json.dumps({"s": sort, "k": encoded}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, sort: str, types: Sequence[type]) -> List[Any]:
+    """Sort key values from a cursor; 400 if it is malformed or from another sort order"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if payload["s"] != sort or len(payload["k"]) != len(types):
+            raise ValueError("cursor does not match sort order")
+        return [
+            datetime.fromisoformat(value) if kind is datetime else kind(value)
+            for value, kind in zip(payload["k"], types)
+        ]
+    except (ValueError, KeyError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+
+def keyset_page(query: Query, sort: str, keys: Sequence, types: Sequence[type], cursor: Optional[str],
+                limit: int, descending: bool = False) -> Tuple[list, Optional[str]]:
+    """One page of query ordered by keys (the last key must be unique, e.g. id).
+    Rows must expose each key under its name (a mapped column or a labelled
+    expression that is also selected).
+    Returns (rows, next_cursor); next_cursor is None on the last page."""
+    if cursor:
+        after = decode_cursor(cursor, sort, types)
+        row_key, cursor_key = tuple_(*keys), tuple_(*after)
+        query = query.filter(row_key < cursor_key if descending else row_key > cursor_key)
+    query = query.order_by(*[key.desc() if descending else key.asc() for key in keys])
+    rows = query.limit(limit + 1).all()  # one extra row tells us whether there is a next page
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(sort, [getattr(rows[-1], key.key) for key in keys])
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]):
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
@@ -0,0 +1,163 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+from dotenv import load_dotenv
+
+from models import User
+from metrics import registry
+
+load_dotenv()
+
+# Authenticated users by token subject (email), so requests skip the user lookup.
+# Entries are snapshots of the user's columns, never the password hash.
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "30"))  # 0 disables the cache
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+# Optional shared tier, e.g. redis://localhost:6380/0; invalidations reach every API process through it
+PRINCIPAL_CACHE_REDIS_URL = os.getenv("PRINCIPAL_CACHE_REDIS_URL", "")
+PRINCIPAL_CACHE_REDIS_TTL = int(os.getenv("PRINCIPAL_CACHE_REDIS_TTL", "300"))
+PRINCIPAL_CACHE_PREFIX = "snapstep:principal:"
+# After an invalidation, puts for that user are ignored this long, so a request
+# that loaded the user before the change cannot write the stale copy back
+PRINCIPAL_CACHE_TOMBSTONE_TTL = int(os.getenv("PRINCIPAL_CACHE_TOMBSTONE_TTL", "10"))
+PRINCIPAL_CACHE_TOMBSTONE_PREFIX = "snapstep:principal-tombstone:"
+
+# KEYS: entry, tombstone; ARGV: ttl, snapshot. Set unless the user was just invalidated.
+_PUT_UNLESS_TOMBSTONED = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return 0
+end
+redis.call('SETEX', KEYS[1], ARGV[1], ARGV[2])
+return 1
+"""
+
+_FIELDS = ("id", "email", "full_name", "tenant_id", "is_active", "is_admin", "created_at", "updated_at")
+_DATETIME_FIELDS = ("created_at", "updated_at")
+
+LOOKUPS = registry.counter("snapstep_principal_cache_lookups_total", "Principal cache lookups, by tier that answered")
+
+def _snapshot(user: User) -> dict:
+    return {field: getattr(user, field) for field in _FIELDS}
+
+def _to_user(snapshot: dict) -> User:
+    """Transient (session-less) User; fine for reading attributes, not for writes"""
+    return User(**snapshot)
+
+def _encode(snapshot: dict) -> str:
+    return json.dumps({k: v.isoformat() if isinstance(v, datetime) else v for k, v in snapshot.items()})
+
+def _decode(raw: str) -> dict:
+    snapshot = json.loads(raw)
+    for field in _DATETIME_FIELDS:
+        if snapshot.get(field):
+            snapshot[field] = datetime.fromisoformat(snapshot[field])
+    return snapshot
+
+class PrincipalCache:
+    """In-process TTL cache of users by email with an optional Redis tier"""
+
+    def __init__(self, ttl: float = PRINCIPAL_CACHE_TTL, max_size: int = PRINCIPAL_CACHE_SIZE,
+                 redis_url: str = PRINCIPAL_CACHE_REDIS_URL, redis_ttl: int = PRINCIPAL_CACHE_REDIS_TTL,
+                 tombstone_ttl: int = PRINCIPAL_CACHE_TOMBSTONE_TTL):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.redis_ttl = redis_ttl
+        self.tombstone_ttl = tombstone_ttl
+        self._entries = OrderedDict()  # email -> (expires_at, snapshot)
+        self._tombstones = {}  # email -> expires_at
+        self._lock = threading.Lock()
+        self._redis = None
+        if redis_url and ttl > 0:
+            import redis
+            self._redis = redis.Redis.from_url(redis_url, decode_responses=True, socket_timeout=0.5)
+            self._put_script = self._redis.register_script(_PUT_UNLESS_TOMBSTONED)
+
+    @property
+    def shared(self) -> bool:
+        """True if lookups may go to Redis (blocking network calls)"""
+        return self._redis is not None
+
+    def _redis_call(self, call, *args, **kwargs):
+        """Redis is an optimisation: errors fall through to the database"""
+        try:
+            return call(*args, **kwargs)
+        except Exception as e:
+            print(f"Principal cache Redis error: {e}")
+            return None
+
+    def _store_local(self, email: str, snapshot: dict):
+        with self._lock:
+            if self._tombstones.get(email, 0) > time.monotonic():
+                return
+            self._entries[email] = (time.monotonic() + self.ttl, snapshot)
+            self._entries.move_to_end(email)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get(self, email: str) -> Optional[User]:
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(email)
+                LOOKUPS.inc(result="local")
+                return _to_user(entry[1])
+            if entry is not None:
+                del self._entries[email]
+
+        if self._redis is not None:
+            raw = self._redis_call(self._redis.get, PRINCIPAL_CACHE_PREFIX + email)
+            if raw:
+                snapshot = _decode(raw)
+                self._store_local(email, snapshot)
+                LOOKUPS.inc(result="redis")
+                return _to_user(snapshot)
+
+        LOOKUPS.inc(result="miss")
+        return None
+
+    def put(self, user: User):
+        if self.ttl <= 0:
+            return
+        snapshot = _snapshot(user)
+        if self._redis is not None:
+            stored = self._redis_call(
+                self._put_script,
+                keys=[PRINCIPAL_CACHE_PREFIX + user.email, PRINCIPAL_CACHE_TOMBSTONE_PREFIX + user.email],
+                args=[self.redis_ttl, _encode(snapshot)]
+            )
+            if stored == 0:
+                return  # invalidated by some API process while this copy was loaded
+        self._store_local(user.email, snapshot)
+
+    def invalidate(self, *emails: str):
+        """Drop users after they are changed or deleted, and ignore puts for them
+        for `tombstone_ttl` seconds. Other API processes keep their local copy for
+        at most `ttl` seconds."""
+        emails = [email for email in emails if email]
+        now = time.monotonic()
+        with self._lock:
+            self._tombstones = {email: expires for email, expires in self._tombstones.items() if expires > now}
+            for email in emails:
+                self._entries.pop(email, None)
+                self._tombstones[email] = now + self.tombstone_ttl
+        if self._redis is not None and emails:
+            pipe = self._redis.pipeline()  # MULTI/EXEC: tombstones and deletes land together
+            for email in emails:
+                pipe.setex(PRINCIPAL_CACHE_TOMBSTONE_PREFIX + email, self.tombstone_ttl, 1)
+            pipe.delete(*[PRINCIPAL_CACHE_PREFIX + email for email in emails])
+            self._redis_call(pipe.execute)
+
+    def hit_ratio(self) -> float:
+        hits = LOOKUPS.value(result="local") + LOOKUPS.value(result="redis")
+        total = hits + LOOKUPS.value(result="miss")
+        return hits / total if total else 0.0
+
+principal_cache = PrincipalCache()
+
+registry.gauge("snapstep_principal_cache_hit_ratio", "Share of principal lookups served from cache",
+               function=principal_cache.hit_ratio)
@@ -0,0 +1,99 @@
+"""Pin the number of SQL queries the guide read endpoints run.
+
+Seeds a tenant with guides, steps and annotations inside a transaction that is
+rolled back afterwards, calls each endpoint (and serializes its response, where
+lazy loads would show up) under database.assert_max_queries, and exits
+non-zero if any endpoint goes over its budget. Budgets do not depend on how
+many steps or annotations a guide has, so an N+1 regression fails here:
+
+    DATABASE_URL=postgresql://... python query_budget.py
+"""
+import argparse
+import secrets
+from typing import List
+from fastapi import Response
+
+from database import SessionLocal, assert_max_queries
+from models import Tenant, User, Guide, Step, Annotation, GuideStatus
+from schemas import GuideResponse, AnnotationResponse
+import main
+
+# Queries per endpoint, excluding authentication
+BUDGETS = {
+    "list_guides": 1,  # guides with a step_count subquery
+    "get_guide": 3,  # ETag state, guide, steps (selectinload)
+    "get_annotations": 3,  # ETag state, guide, annotations (selectinload)
+}
+
+def seed(db, guides: int, steps: int) -> tuple:
+    """Tenant, user and guides with `steps` steps and annotations each (flushed, not committed)"""
+    suffix = secrets.token_hex(4)
+    tenant = Tenant(name="Query budget", slug=f"query-budget-{suffix}")
+    db.add(tenant)
+    db.flush()
+    user = User(email=f"query-budget-{suffix}@snapstep.local", tenant_id=tenant.id, is_active=True)
+    db.add(user)
+    db.flush()
+    guide_ids = []
+    for g in range(guides):
+        guide = Guide(tenant_id=tenant.id, owner_id=user.id, title=f"Guide {g}", status=GuideStatus.DRAFT)
+        db.add(guide)
+        db.flush()
+        guide_ids.append(guide.id)
+        for i in range(steps):
+            step = Step(tenant_id=tenant.id, guide_id=guide.id, index=i, title=f"Step {i}",
+                        screenshot_key=f"tenant_{tenant.id}/query-budget/{guide.id}-{i}.png")
+            db.add(step)
+            db.flush()
+            db.add(Annotation(tenant_id=tenant.id, guide_id=guide.id, step_id=step.id, type="rectangle",
+                              data={"x": 0, "y": 0, "width": 10, "height": 10}))
+    db.flush()
+    db.expunge_all()  # endpoints must load everything themselves
+    return user, guide_ids
+
+def check(name: str, call) -> int:
+    with assert_max_queries(BUDGETS[name]) as counter:
+        call()
+    print(f"{name}: {counter.count} queries (budget {BUDGETS[name]})")
+    return counter.count
+
+def run(guides: int, steps: int) -> List[str]:
+    """Check every budget; returns the failures"""
+    db = SessionLocal()
+    failures = []
+    try:
+        user, guide_ids = seed(db, guides, steps)
+        guide_id = guide_ids[0]
+        calls = {
+            "list_guides": lambda: main.list_guides(
+                Response(), cursor=None, limit=100, sort="updated", status=None, owner_id=None, skip=0,
+                db=db, current_user=user
+            ),
+            "get_guide": lambda: GuideResponse.model_validate(main.get_guide(
+                guide_id, Response(), variant="preview", if_none_match=None, db=db, current_user=user
+            )),
+            "get_annotations": lambda: [AnnotationResponse.model_validate(a) for a in main.get_annotations(
+                guide_id, Response(), if_none_match=None, db=db, current_user=user
+            )],
+        }
+        for name, call in calls.items():
+            try:
+                check(name, call)
+            except AssertionError as e:
+                failures.append(f"{name}: {e}")
+            db.expunge_all()
+    finally:
+        db.rollback()
+        db.close()
+    return failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--guides", type=int, default=5)
+    parser.add_argument("--steps", type=int, default=25, help="Steps (and annotations) per guide")
+    args = parser.parse_args()
+
+    failures = run(args.guides, args.steps)
+    if failures:
+        raise SystemExit("Query budget exceeded:\n" + "\n".join(failures))
+    print("All query budgets hold")
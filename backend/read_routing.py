@@ -0,0 +1,82 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Dict, Optional
+from fastapi import Request
+from dotenv import load_dotenv
+
+from database import SessionLocal, AsyncSessionLocal, DATABASE_REPLICA_URLS, replica_session, async_replica_session
+
+load_dotenv()
+
+# API-only half of read-replica routing: which requests may read from a replica.
+# Kept out of database.py, which the worker imports without FastAPI installed.
+
+# After a client writes, its reads go to the primary for this long (replication lag budget)
+READ_YOUR_WRITES_SECONDS = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", "5"))
+
+class ReadYourWrites:
+    """Remembers which clients wrote recently so their reads skip the replicas.
+    Keyed by a hash of the Authorization header; each API process tracks its own
+    clients, and the stickiness cookie covers requests landing on other processes."""
+
+    COOKIE = "snapstep_primary_until"
+
+    def __init__(self, seconds: float = READ_YOUR_WRITES_SECONDS):
+        self.seconds = seconds
+        self._until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def client_key(request: Request) -> Optional[str]:
+        auth = request.headers.get("authorization")
+        return hashlib.sha256(auth.encode()).hexdigest() if auth else None
+
+    def mark_write(self, request: Request) -> float:
+        """Record a write by this request's client; returns the sticky deadline (epoch seconds)"""
+        until = time.time() + self.seconds
+        key = self.client_key(request)
+        if key:
+            with self._lock:
+                self._until[key] = until
+                if len(self._until) > 10000:
+                    now = time.time()
+                    self._until = {k: v for k, v in self._until.items() if v > now}
+        return until
+
+    def is_sticky(self, request: Request) -> bool:
+        now = time.time()
+        try:
+            if float(request.cookies.get(self.COOKIE, 0)) > now:
+                return True
+        except ValueError:
+            pass
+        key = self.client_key(request)
+        if key:
+            with self._lock:
+                return self._until.get(key, 0) > now
+        return False
+
+read_your_writes = ReadYourWrites()
+
+def get_read_db(request: Request):
+    """Session for read-only endpoints: a replica (round robin) when configured,
+    unless this client wrote within READ_YOUR_WRITES_SECONDS"""
+    if not DATABASE_REPLICA_URLS or read_your_writes.is_sticky(request):
+        db = SessionLocal()
+    else:
+        db = replica_session()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_read_db(request: Request):
+    """AsyncSession counterpart of get_read_db, for async_routes.py"""
+    if not DATABASE_REPLICA_URLS or read_your_writes.is_sticky(request):
+        db = AsyncSessionLocal()
+    else:
+        db = async_replica_session()
+    async with db:
+        yield db
@@ -1,7 +1,8 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field, field_validator
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from models import SessionStatus, GuideStatus, ExportJobStatus
+from exports import EXPORT_PROFILES, DEFAULT_EXPORT_PROFILE, EXPORT_PRIORITIES
 
 # Auth
 class Token(BaseModel):
@@ -49,15 +50,67 @@ class SessionResponse(BaseModel):
     class Config:
         from_attributes = True
 
+# Uploads
+class UploadFinalize(BaseModel):
+    key: str
+
+class UploadRequestItem(BaseModel):
+    filename: str
+    content_type: str = "image/png"
+    sha256: Optional[str] = Field(None, pattern="^[0-9a-fA-F]{64}$")
+
+class UploadBatchRequest(BaseModel):
+    files: List[UploadRequestItem] = Field(..., min_length=1, max_length=200)
+    method: str = Field("put", pattern="^(put|post)$")  # presigned PUT URLs or POST policies
+
+class UploadTicket(BaseModel):
+    key: str
+    exists: bool = False  # content-addressed bytes already stored; nothing to upload
+    upload_url: Optional[str] = None
+    fields: Optional[Dict[str, str]] = None  # form fields for method=post
+    headers: Optional[Dict[str, str]] = None  # request headers for method=put
+    expires_in: int = 0
+
+class UploadBatchResponse(BaseModel):
+    uploads: List[UploadTicket]  # in request order
+
+class ScreenshotAssetResponse(BaseModel):
+    key: str
+    width: Optional[int]
+    height: Optional[int]
+    byte_size: int
+    mime_type: Optional[str]
+    sha256: str
+    phash: Optional[str] = None
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+class UsageResponse(BaseModel):
+    screenshot_count: int
+    screenshot_bytes: int
+
 # Steps
-class StepCreate(BaseModel):
-    session_id: int
+class StepBatchItem(BaseModel):
     index: int
     title: Optional[str] = None
     description: Optional[str] = None
     screenshot_key: str
     action_type: Optional[str] = None
     action_context: Optional[Dict[str, Any]] = None
+    # Client-generated (e.g. a UUID); a retried step with the same key is not inserted again
+    idempotency_key: Optional[str] = Field(None, max_length=128)
+
+class StepCreate(StepBatchItem):
+    session_id: int
+
+class StepBatchCreate(BaseModel):
+    steps: List[StepBatchItem] = Field(..., min_length=1, max_length=500)
+
+class StepBatchResponse(BaseModel):
+    step_ids: List[int]  # in request order, including steps that already existed
+    created: int
 
 class StepResponse(BaseModel):
     id: int
@@ -67,7 +120,9 @@ class StepResponse(BaseModel):
     title: Optional[str]
     description: Optional[str]
     screenshot_key: Optional[str]
-    screenshot_url: Optional[str] = None  # Populated on demand
+    screenshot_url: Optional[str] = None  # Populated on demand, in the requested variant
+    thumbnail_url: Optional[str] = None
+    duplicate_of_step_id: Optional[int] = None
     action_type: Optional[str]
     action_context: Optional[Dict[str, Any]]
     created_at: datetime
@@ -93,6 +148,23 @@ class GuideResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class GuideSummary(BaseModel):
+    """Guide fields for list views: no steps or content"""
+    id: int
+    tenant_id: int
+    owner_id: int
+    session_id: Optional[int]
+    title: str
+    description: Optional[str]
+    status: GuideStatus
+    share_token: Optional[str]
+    created_at: datetime
+    updated_at: Optional[datetime]
+    step_count: int = 0
+    
+    class Config:
+        from_attributes = True
+
 class GuideUpdate(BaseModel):
     title: Optional[str] = None
     description: Optional[str] = None
@@ -121,11 +193,31 @@ class AnnotationResponse(BaseModel):
 class ExportRequest(BaseModel):
     guide_id: int
     format: str = "pdf"
+    profile: str = DEFAULT_EXPORT_PROFILE
+    priority: str = "interactive"  # interactive or bulk
+    collapse_duplicates: bool = False  # omit screenshots of near-duplicate consecutive steps
+    
+    @field_validator("profile")
+    @classmethod
+    def validate_profile(cls, value: str) -> str:
+        if value not in EXPORT_PROFILES:
+            raise ValueError(f"Unknown export profile, expected one of: {', '.join(EXPORT_PROFILES)}")
+        return value
+    
+    @field_validator("priority")
+    @classmethod
+    def validate_priority(cls, value: str) -> str:
+        if value not in EXPORT_PRIORITIES:
+            raise ValueError(f"Unknown priority, expected one of: {', '.join(EXPORT_PRIORITIES)}")
+        return value
 
 class ExportResponse(BaseModel):
     job_id: int
     status: ExportJobStatus
     download_url: Optional[str] = None
+    profile: Optional[str] = None
+    output_bytes: Optional[int] = None
+    render_ms: Optional[int] = None
     
     class Config:
         from_attributes = True
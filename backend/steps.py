@@ -0,0 +1,67 @@
+import uuid
+from typing import List, Optional
+from fastapi import HTTPException
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from models import Step
+from storage import get_cached_download_url, owned_by_tenant
+
+SCREENSHOT_VARIANTS = {
+    "thumbnail": "thumbnail_key",
+    "preview": "preview_key",
+    "print": "print_key",
+    "original": "screenshot_key",
+}
+
+def screenshot_variant_key(step: Step, variant: str) -> Optional[str]:
+    """Key of the requested screenshot variant, falling back to the original
+    until the worker has generated it"""
+    return getattr(step, SCREENSHOT_VARIANTS[variant]) or step.screenshot_key
+
+def attach_screenshot_urls(steps: List[Step], variant: str):
+    """Set screenshot_url (requested variant) and thumbnail_url on each step"""
+    for step in steps:
+        if step.screenshot_key:
+            step.screenshot_url = get_cached_download_url(screenshot_variant_key(step, variant), expires_in=3600)
+            step.thumbnail_url = get_cached_download_url(screenshot_variant_key(step, "thumbnail"), expires_in=3600)
+
+def check_screenshot_keys(tenant_id: int, items):
+    """Steps may only point at the tenant's own uploads: the worker and the
+    signed URLs in guide responses would otherwise read another tenant's objects"""
+    for item in items:
+        if item.screenshot_key and not owned_by_tenant(item.screenshot_key, tenant_id):
+            raise HTTPException(status_code=400, detail=f"Invalid screenshot_key: {item.screenshot_key}")
+
+def find_step_by_idempotency_key(db: Session, tenant_id: int, idempotency_key: Optional[str]) -> Optional[Step]:
+    if not idempotency_key:
+        return None
+    return db.query(Step).filter(
+        Step.tenant_id == tenant_id,
+        Step.idempotency_key == idempotency_key
+    ).first()
+
+def batch_step_rows(tenant_id: int, session_id: int, items) -> List[dict]:
+    """Insert rows for a step batch. Steps without a client key get a server one
+    so every row can be matched back to its request item."""
+    return [
+        {
+            "tenant_id": tenant_id,
+            "session_id": session_id,
+            "index": item.index,
+            "title": item.title,
+            "description": item.description,
+            "screenshot_key": item.screenshot_key,
+            "action_type": item.action_type,
+            "action_context": item.action_context,
+            "idempotency_key": item.idempotency_key or f"srv-{uuid.uuid4()}",
+        }
+        for item in items
+    ]
+
+def batch_insert_statement(rows: List[dict]):
+    """One INSERT for the whole batch; rows whose key already exists are skipped.
+    Returns (id, idempotency_key) of the rows actually inserted."""
+    return pg_insert(Step).values(rows).on_conflict_do_nothing(
+        index_elements=["tenant_id", "idempotency_key"]
+    ).returning(Step.id, Step.idempotency_key)
@@ -1,10 +1,21 @@
+import base64
 import boto3
+import hashlib
+import hmac
 from botocore.config import Config
 from botocore.exceptions import ClientError
-from datetime import timedelta
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
 import os
+import re
+import threading
+import time
 from dotenv import load_dotenv
+from typing import Optional
 import uuid
+from urllib.parse import quote, urlsplit
+
+from metrics import registry
 
 load_dotenv()
 
@@ -13,46 +24,128 @@ S3_BUCKET = os.getenv("S3_BUCKET", "snapstep-assets")
 S3_ACCESS_KEY = os.getenv("S3_ACCESS_KEY", "minioadmin")
 S3_SECRET_KEY = os.getenv("S3_SECRET_KEY", "minioadmin123")
 S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "32"))
+# Signed download URLs are reused for this long, so repeated reads return the same URL
+URL_SIGNING_WINDOW = int(os.getenv("URL_SIGNING_WINDOW_SECONDS", "900"))
+SIGNED_URL_CACHE_SIZE = int(os.getenv("SIGNED_URL_CACHE_SIZE", "10000"))
+
+SIGNED_URL_CACHE = registry.counter("snapstep_signed_url_cache_total", "Signed download URL lookups, by result")
 
-# Configure S3 client for MinIO
+# Configure S3 client for MinIO. The client is thread-safe and shared; its
+# connection pool must be at least as large as the number of threads using it.
 s3_client = boto3.client(
     's3',
     endpoint_url=S3_ENDPOINT,
     aws_access_key_id=S3_ACCESS_KEY,
     aws_secret_access_key=S3_SECRET_KEY,
     region_name=S3_REGION,
-    config=Config(signature_version='s3v4')
+    config=Config(signature_version='s3v4', max_pool_connections=S3_MAX_POOL_CONNECTIONS)
 )
 
+_bucket_ready = False
+_bucket_lock = threading.Lock()
+
 def ensure_bucket_exists():
-    """Ensure the bucket exists, create if it doesn't"""
-    try:
-        s3_client.head_bucket(Bucket=S3_BUCKET)
-    except ClientError:
-        s3_client.create_bucket(Bucket=S3_BUCKET)
+    """Ensure the bucket exists, create if it doesn't. Checked once per process;
+    later calls return without a round trip to S3."""
+    global _bucket_ready
+    if _bucket_ready:
+        return
+    with _bucket_lock:
+        if _bucket_ready:
+            return
+        try:
+            s3_client.head_bucket(Bucket=S3_BUCKET)
+        except ClientError:
+            s3_client.create_bucket(Bucket=S3_BUCKET)
+        _bucket_ready = True
 
-def get_presigned_upload_url(filename: str, content_type: str = "image/png", tenant_id: int = None) -> tuple:
-    """Generate presigned URL for uploading a file. Returns (url, key) tuple."""
-    ensure_bucket_exists()
-    
-    # Generate unique key with tenant prefix
+def content_addressed_key(sha256: str, filename: str, tenant_id: int = None) -> str:
+    """Key for content-addressed uploads: identical bytes map to one object per tenant"""
+    tenant_prefix = f"tenant_{tenant_id}" if tenant_id else "default"
+    ext = os.path.splitext(filename)[1].lower()
+    return f"{tenant_prefix}/cas/{sha256.lower()}{ext}"
+
+# tenant_<id>/cas/<sha256>[.ext], exactly as content_addressed_key builds it
+CONTENT_ADDRESS_RE = re.compile(r"^tenant_\d+/cas/([0-9a-f]{64})(\.[^/]*)?$")
+
+def content_address(key: str) -> Optional[str]:
+    """SHA-256 (hex) a content-addressed key claims for its bytes, or None for other keys"""
+    match = CONTENT_ADDRESS_RE.match(key)
+    return match.group(1) if match else None
+
+def owned_by_tenant(key: str, tenant_id: int) -> bool:
+    """Whether a client-supplied object key is under the tenant's prefix"""
+    return key.startswith(f"tenant_{tenant_id}/") and ".." not in key.split("/")
+
+def sha256_checksum(sha256: str) -> str:
+    """x-amz-checksum-sha256 value (base64 digest) for a hex SHA-256"""
+    return base64.b64encode(bytes.fromhex(sha256)).decode()
+
+def upload_headers(content_type: str, sha256: str = None) -> dict:
+    """Headers the client must send with a presigned PUT. With sha256 the
+    checksum is part of the signature and S3 rejects any other bytes."""
+    headers = {"Content-Type": content_type}
+    if sha256:
+        headers["x-amz-checksum-sha256"] = sha256_checksum(sha256)
+    return headers
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))  # enforced by presigned POST policies
+
+def new_upload_key(filename: str, tenant_id: int = None, sha256: str = None) -> str:
+    """Unique key with tenant prefix, or a content-addressed one when sha256 is given"""
+    if sha256:
+        return content_addressed_key(sha256, filename, tenant_id)
     tenant_prefix = f"tenant_{tenant_id}" if tenant_id else "default"
-    key = f"{tenant_prefix}/{uuid.uuid4()}/{filename}"
+    return f"{tenant_prefix}/{uuid.uuid4()}/{filename}"
+
+def get_presigned_upload_url(filename: str, content_type: str = "image/png", tenant_id: int = None,
+                             sha256: str = None) -> tuple:
+    """Generate presigned URL for uploading a file. Returns (url, key) tuple.
+    With sha256 the key is content-addressed instead of unique per upload, and
+    the URL only accepts those bytes (send upload_headers() with the PUT)."""
+    ensure_bucket_exists()
+    key = new_upload_key(filename, tenant_id, sha256)
+    params = {
+        'Bucket': S3_BUCKET,
+        'Key': key,
+        'ContentType': content_type
+    }
+    if sha256:
+        params['ChecksumSHA256'] = sha256_checksum(sha256)
     
     try:
         url = s3_client.generate_presigned_url(
             'put_object',
-            Params={
-                'Bucket': S3_BUCKET,
-                'Key': key,
-                'ContentType': content_type
-            },
+            Params=params,
             ExpiresIn=3600  # 1 hour
         )
         return url, key
     except ClientError as e:
         raise Exception(f"Error generating presigned URL: {e}")
 
+def get_presigned_upload_post(key: str, content_type: str = "image/png", expires_in: int = 3600,
+                              sha256: str = None) -> dict:
+    """Presigned POST policy for a browser form upload: {"url", "fields"}. Unlike a
+    presigned PUT it also pins the content type and caps the size at UPLOAD_MAX_BYTES.
+    With sha256 the policy also pins the upload's checksum."""
+    ensure_bucket_exists()
+    fields = {"Content-Type": content_type}
+    if sha256:
+        fields["x-amz-checksum-sha256"] = sha256_checksum(sha256)
+    conditions = [{name: value} for name, value in fields.items()]
+    conditions.append(["content-length-range", 1, UPLOAD_MAX_BYTES])
+    try:
+        return s3_client.generate_presigned_post(
+            Bucket=S3_BUCKET,
+            Key=key,
+            Fields=fields,
+            Conditions=conditions,
+            ExpiresIn=expires_in
+        )
+    except ClientError as e:
+        raise Exception(f"Error generating presigned POST: {e}")
+
 def get_presigned_download_url(key: str, expires_in: int = 3600) -> str:
     """Generate presigned URL for downloading a file"""
     try:
@@ -65,8 +158,101 @@ def get_presigned_download_url(key: str, expires_in: int = 3600) -> str:
     except ClientError as e:
         raise Exception(f"Error generating download URL: {e}")
 
+def signing_window(now: float = None) -> int:
+    """Index of the fixed URL-signing window containing `now`"""
+    return int((time.time() if now is None else now) // URL_SIGNING_WINDOW)
+
+def _hmac(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode(), hashlib.sha256).digest()
+
+def presign_download_at(key: str, signed_at: int, expires_in: int) -> str:
+    """Presigned GET URL as if signed at `signed_at` (epoch seconds). boto3 always
+    signs with the current time; this is plain SigV4 query signing with the date
+    pinned, so every process returns the same URL for the same arguments.
+    The object URL (endpoint and addressing style) still comes from boto3."""
+    base = urlsplit(get_presigned_download_url(key, expires_in=1))
+    stamp = datetime.fromtimestamp(signed_at, timezone.utc)
+    amz_date, day = stamp.strftime("%Y%m%dT%H%M%SZ"), stamp.strftime("%Y%m%d")
+    scope = f"{day}/{S3_REGION}/s3/aws4_request"
+    params = {
+        "X-Amz-Algorithm": "AWS4-HMAC-SHA256",
+        "X-Amz-Credential": f"{S3_ACCESS_KEY}/{scope}",
+        "X-Amz-Date": amz_date,
+        "X-Amz-Expires": str(expires_in),
+        "X-Amz-SignedHeaders": "host",
+    }
+    query = "&".join(f"{quote(k, safe='-_.~')}={quote(v, safe='-_.~')}" for k, v in sorted(params.items()))
+    canonical_request = "\n".join(["GET", base.path, query, f"host:{base.netloc}", "", "host", "UNSIGNED-PAYLOAD"])
+    string_to_sign = "\n".join([
+        "AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical_request.encode()).hexdigest()
+    ])
+    signing_key = ("AWS4" + S3_SECRET_KEY).encode()
+    for part in (day, S3_REGION, "s3", "aws4_request"):
+        signing_key = _hmac(signing_key, part)
+    signature = hmac.new(signing_key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+    return f"{base.scheme}://{base.netloc}{base.path}?{query}&X-Amz-Signature={signature}"
+
+class SignedUrlCache:
+    """Signed download URLs per (object key, expiry) for the current signing
+    window. URLs are signed as of the window start (presign_download_at), so they
+    are byte-identical across API processes and cache evictions; this cache only
+    saves re-signing. They are valid for expires_in plus one window from the
+    window start, so a URL handed out at the end of its window still has at
+    least expires_in seconds. Identical URLs let browsers and CDNs cache the objects."""
+
+    def __init__(self, max_size: int = SIGNED_URL_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # (key, expires_in) -> (window, url)
+        self._lock = threading.Lock()
+
+    def get(self, key: str, expires_in: int = 3600) -> str:
+        cache_key = (key, expires_in)
+        window = signing_window()
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry[0] == window:
+                self._entries.move_to_end(cache_key)
+                SIGNED_URL_CACHE.inc(result="hit")
+                return entry[1]
+
+        SIGNED_URL_CACHE.inc(result="miss")
+        # Sign outside the lock; concurrent misses for one key sign the same URL twice
+        url = presign_download_at(key, window * URL_SIGNING_WINDOW, expires_in + URL_SIGNING_WINDOW)
+        with self._lock:
+            self._entries[cache_key] = (window, url)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return url
+
+    def invalidate(self, key: str):
+        with self._lock:
+            for cache_key in [k for k in self._entries if k[0] == key]:
+                del self._entries[cache_key]
+
+signed_url_cache = SignedUrlCache()
+
+def get_cached_download_url(key: str, expires_in: int = 3600) -> str:
+    """Signed download URL that stays byte-identical within a signing window"""
+    return signed_url_cache.get(key, expires_in)
+
+def stored_checksum_matches(key: str) -> Optional[bool]:
+    """Whether a content-addressed object's S3-verified checksum matches its key.
+    None if S3 has no checksum for it (then only downloading and hashing can tell);
+    raises ClientError if the object does not exist."""
+    try:
+        expected = sha256_checksum(content_address(key))
+    except ValueError:
+        return False  # not a SHA-256, so nothing can match it
+    response = s3_client.head_object(Bucket=S3_BUCKET, Key=key, ChecksumMode="ENABLED")
+    stored = response.get("ChecksumSHA256")
+    if not stored or "-" in stored:  # absent, or a multipart checksum of part checksums
+        return None
+    return stored == expected
+
 def delete_object(key: str) -> bool:
     """Delete an object from S3"""
+    signed_url_cache.invalidate(key)
     try:
         s3_client.delete_object(Bucket=S3_BUCKET, Key=key)
         return True
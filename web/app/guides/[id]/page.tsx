@@ -225,10 +225,11 @@ export default function GuideEditorPage() {
               <div style={{ fontWeight: '500', marginBottom: '0.25rem' }}>
                 Step {step.index + 1}: {step.title || 'Untitled'}
               </div>
-              {step.screenshot_url && (
+              {(step.thumbnail_url || step.screenshot_url) && (
                 <img
-                  src={step.screenshot_url}
+                  src={step.thumbnail_url || step.screenshot_url || undefined}
                   alt={`Step ${step.index + 1}`}
+                  loading="lazy"
                   style={{
                     width: '100%',
                     marginTop: '0.5rem',
@@ -2,12 +2,12 @@
 
 import { useEffect, useState } from 'react';
 import { useRouter } from 'next/navigation';
-import { apiClient, Guide } from '@/lib/api';
+import { apiClient, GuideSummary } from '@/lib/api';
 import Link from 'next/link';
 
 export default function GuidesPage() {
   const router = useRouter();
-  const [guides, setGuides] = useState<Guide[]>([]);
+  const [guides, setGuides] = useState<GuideSummary[]>([]);
   const [loading, setLoading] = useState(true);
   const [mounted, setMounted] = useState(false);
   const [isAdmin, setIsAdmin] = useState(false);
@@ -131,7 +131,7 @@ export default function GuidesPage() {
                 </p>
               )}
               <div style={{ color: '#999', fontSize: '0.8rem' }}>
-                {guide.steps?.length || 0} steps • {guide.status}
+                {guide.step_count} steps • {guide.status}
               </div>
             </Link>
           ))}
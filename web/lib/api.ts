@@ -58,6 +58,8 @@ export interface Step {
   description: string | null;
   screenshot_key: string | null;
   screenshot_url?: string | null;
+  thumbnail_url?: string | null;
+  duplicate_of_step_id?: number | null;
   action_type: string | null;
   action_context: any;
   created_at: string;
@@ -78,6 +80,20 @@ export interface Guide {
   steps: Step[];
 }
 
+export interface GuideSummary {
+  id: number;
+  tenant_id: number;
+  owner_id: number;
+  session_id: number | null;
+  title: string;
+  description: string | null;
+  status: string;
+  share_token: string | null;
+  created_at: string;
+  updated_at: string | null;
+  step_count: number;
+}
+
 export interface Annotation {
   id: number;
   guide_id: number;
@@ -158,13 +174,29 @@ export const apiClient = {
   },
 
   // Uploads
-  async getPresignedUrl(filename: string, contentType: string = 'image/png') {
+  // Pass the file's SHA-256 (hex) for a content-addressed key; when `exists`
+  // is true the bytes are already stored and the upload can be skipped.
+  // Otherwise send `upload_headers` with the PUT: the URL only accepts those bytes.
+  async getPresignedUrl(filename: string, contentType: string = 'image/png', sha256?: string) {
     const response = await api.post('/v1/uploads', null, {
-      params: { filename, content_type: contentType },
+      params: { filename, content_type: contentType, sha256 },
     });
     return response.data;
   },
 
+  async getPresignedUrls(files: Array<{ filename: string; content_type?: string; sha256?: string }>,
+                         method: 'put' | 'post' = 'put') {
+    const response = await api.post('/v1/uploads:batch', { files, method });
+    return response.data.uploads as Array<{
+      key: string;
+      exists: boolean;
+      upload_url: string | null;
+      fields: Record<string, string> | null;
+      headers: Record<string, string> | null;
+      expires_in: number;
+    }>;
+  },
+
   // Steps
   async createStep(stepData: {
     session_id: number;
@@ -174,13 +206,27 @@ export const apiClient = {
     screenshot_key: string;
     action_type?: string;
     action_context?: any;
+    idempotency_key?: string;
   }) {
     const response = await api.post('/v1/steps', stepData);
     return response.data;
   },
 
+  async createStepsBatch(sessionId: number, steps: Array<{
+    index: number;
+    title?: string;
+    description?: string;
+    screenshot_key: string;
+    action_type?: string;
+    action_context?: any;
+    idempotency_key?: string;
+  }>): Promise<{ step_ids: number[]; created: number }> {
+    const response = await api.post(`/v1/sessions/${sessionId}/steps:batch`, { steps });
+    return response.data;
+  },
+
   // Guides
-  async listGuides() {
+  async listGuides(): Promise<GuideSummary[]> {
     const response = await api.get('/v1/guides');
     return response.data;
   },
@@ -227,8 +273,8 @@ export const apiClient = {
   },
 
   // Exports
-  async requestExport(guideId: number, format: string = 'pdf') {
-    const response = await api.post('/v1/exports/pdf', { guide_id: guideId, format });
+  async requestExport(guideId: number, format: string = 'pdf', profile: string = 'screen') {
+    const response = await api.post('/v1/exports/pdf', { guide_id: guideId, format, profile });
     return response.data;
   },
 
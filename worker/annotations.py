@@ -0,0 +1,131 @@
+import hashlib
+import json
+import math
+from typing import Dict, List, Optional, Tuple
+from PIL import Image as PILImage, ImageColor, ImageDraw, ImageFilter
+
+# Annotation data is in pixels of the original screenshot:
+#   rectangle, circle, blur, pixelate: {"x", "y", "width", "height"}
+#   arrow: {"x1", "y1", "x2", "y2"}
+# Optional style keys: "color" (CSS color, "#rrggbbaa" for translucency),
+# "stroke_width", "fill" (rectangle/circle), "radius" (blur), "block_size" (pixelate).
+# Unknown types are ignored so newer editors do not break exports. A malformed
+# shape is skipped, but a malformed blur or pixelate raises RedactionError: the
+# region it was meant to hide must never be exported in the clear.
+
+DEFAULT_COLOR = "#ff3b30"
+DEFAULT_STROKE_WIDTH = 4
+DEFAULT_BLUR_RADIUS = 12
+DEFAULT_BLOCK_SIZE = 12
+
+REGION_EFFECTS = ("blur", "pixelate")
+SHAPES = ("rectangle", "circle", "arrow")
+
+class RedactionError(ValueError):
+    """A blur/pixelate annotation could not be applied"""
+
+def annotation_set_hash(annotations: List[dict]) -> str:
+    """Stable hash of a step's annotations, independent of their ids and row order"""
+    items = sorted(json.dumps({"type": a["type"], "data": a["data"]}, sort_keys=True) for a in annotations)
+    return hashlib.sha256(json.dumps(items).encode()).hexdigest()
+
+def _box(data: dict, scale: float, size: Tuple[int, int]) -> Optional[Tuple[int, int, int, int]]:
+    """Scaled (left, top, right, bottom) clamped to the image, or None if empty"""
+    x, y = float(data["x"]) * scale, float(data["y"]) * scale
+    w, h = float(data["width"]) * scale, float(data["height"]) * scale
+    left, right = sorted((x, x + w))
+    top, bottom = sorted((y, y + h))
+    box = (max(0, int(left)), max(0, int(top)), min(size[0], int(math.ceil(right))), min(size[1], int(math.ceil(bottom))))
+    if box[2] <= box[0] or box[3] <= box[1]:
+        return None
+    return box
+
+def _color(value, default: str = DEFAULT_COLOR) -> Tuple[int, int, int, int]:
+    rgba = ImageColor.getrgb(value or default)
+    return rgba if len(rgba) == 4 else rgba + (255,)
+
+def _apply_region_effect(img: PILImage.Image, kind: str, data: dict, scale: float):
+    """Blur or pixelate a region in place. Whole-region Pillow operations, no per-pixel Python."""
+    box = _box(data, scale, img.size)
+    if box is None:
+        return
+    region = img.crop(box)
+    if kind == "blur":
+        radius = max(1.0, float(data.get("radius", DEFAULT_BLUR_RADIUS)) * scale)
+        region = region.filter(ImageFilter.GaussianBlur(radius))
+    else:
+        block = max(2, int(round(float(data.get("block_size", DEFAULT_BLOCK_SIZE)) * scale)))
+        small = region.resize((max(1, region.width // block), max(1, region.height // block)), PILImage.Resampling.BOX)
+        region = small.resize(region.size, PILImage.Resampling.NEAREST)
+    img.paste(region, box)
+
+def _draw_arrow(draw: ImageDraw.ImageDraw, data: dict, scale: float, color, width: int):
+    x1, y1 = float(data["x1"]) * scale, float(data["y1"]) * scale
+    x2, y2 = float(data["x2"]) * scale, float(data["y2"]) * scale
+    angle = math.atan2(y2 - y1, x2 - x1)
+    head = max(10.0, width * 4.0)
+    # Stop the shaft at the base of the head so the tip stays sharp
+    base_x, base_y = x2 - head * 0.8 * math.cos(angle), y2 - head * 0.8 * math.sin(angle)
+    draw.line([(x1, y1), (base_x, base_y)], fill=color, width=width)
+    spread = math.radians(28)
+    draw.polygon([
+        (x2, y2),
+        (x2 - head * math.cos(angle - spread), y2 - head * math.sin(angle - spread)),
+        (x2 - head * math.cos(angle + spread), y2 - head * math.sin(angle + spread)),
+    ], fill=color)
+
+def composite_annotations(img: PILImage.Image, annotations: List[dict], scale: float = 1.0) -> PILImage.Image:
+    """Burn annotations into a screenshot in one pass.
+
+    Region effects (blur, pixelate) are applied first, so shapes drawn over a
+    redacted area stay crisp; then every shape is drawn onto a single
+    transparent layer that is alpha-composited over the image once. `scale`
+    maps annotation coordinates (original screenshot pixels) onto img, e.g.
+    when img is an already-downscaled derivative."""
+    if not annotations:
+        return img
+    has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+    base = img.convert("RGBA")
+
+    for annotation in annotations:
+        if annotation["type"] in REGION_EFFECTS:
+            try:
+                _apply_region_effect(base, annotation["type"], annotation["data"], scale)
+            except (AttributeError, KeyError, TypeError, ValueError) as e:
+                raise RedactionError(f"Malformed {annotation['type']} annotation: {e!r}") from e
+
+    shapes = [a for a in annotations if a["type"] in SHAPES]
+    if shapes:
+        overlay = PILImage.new("RGBA", base.size, (0, 0, 0, 0))
+        draw = ImageDraw.Draw(overlay)
+        for annotation in shapes:
+            data = annotation["data"]
+            try:
+                color = _color(data.get("color"))
+                width = max(1, int(round(float(data.get("stroke_width", DEFAULT_STROKE_WIDTH)) * scale)))
+                if annotation["type"] == "arrow":
+                    _draw_arrow(draw, data, scale, color, width)
+                    continue
+                box = _box(data, scale, base.size)
+                if box is None:
+                    continue
+                fill = _color(data["fill"]) if data.get("fill") else None
+                if annotation["type"] == "rectangle":
+                    draw.rectangle(box, outline=color, fill=fill, width=width)
+                else:
+                    draw.ellipse(box, outline=color, fill=fill, width=width)
+            except (AttributeError, KeyError, TypeError, ValueError) as e:
+                print(f"Skipping malformed {annotation['type']} annotation: {e}")
+        base = PILImage.alpha_composite(base, overlay)
+
+    return base if has_alpha else base.convert("RGB")
+
+def group_by_step(annotations) -> Dict[int, List[dict]]:
+    """Annotation rows -> {step_id: [{"type", "data"}]} as plain (picklable) dicts,
+    in creation order. Guide-level annotations (no step) are not drawn on screenshots."""
+    grouped: Dict[int, List[dict]] = {}
+    for annotation in sorted(annotations, key=lambda a: a.id):
+        if annotation.step_id is None or annotation.type not in REGION_EFFECTS + SHAPES:
+            continue
+        grouped.setdefault(annotation.step_id, []).append({"type": annotation.type, "data": annotation.data or {}})
+    return grouped
@@ -0,0 +1,312 @@
+import os
+import hashlib
+import threading
+import time
+from io import BytesIO
+from typing import Optional
+from sqlalchemy import or_, text
+from sqlalchemy.exc import IntegrityError
+from PIL import Image as PILImage
+
+from models import Step, ScreenshotAsset, bump_guide_version
+from storage import s3_client, S3_BUCKET, content_address, delete_object
+from exports import EXPORT_PROFILES
+from job_queue import DERIVATIVES_QUEUE, ASSETS_QUEUE
+from imaging import image_stage, dhash, hamming_distance
+
+# Variants generated for every uploaded screenshot:
+# (Step column, image params for process_image, file extension, content type)
+_print_width, _print_height = EXPORT_PROFILES["print"].max_pixels()
+DERIVATIVES = {
+    "thumbnail": ("thumbnail_key", {"max_width": 320, "image_format": "WEBP", "quality": 70}, "webp", "image/webp"),
+    "preview": ("preview_key", {"max_width": 1280, "image_format": "WEBP", "quality": 80}, "webp", "image/webp"),
+    # Sized and encoded exactly like the "print" export profile so exports can embed it as-is
+    "print": ("print_key", {"max_width": _print_width, "max_height": _print_height, "image_format": "PNG"}, "png", "image/png"),
+}
+
+BACKFILL_BATCH = int(os.getenv("DERIVATIVES_BACKFILL_BATCH", "50"))
+# Steps that failed are left out of the backfill for this long; at most this many are remembered
+BACKFILL_RETRY_SECONDS = float(os.getenv("DERIVATIVES_BACKFILL_RETRY_SECONDS", "3600"))
+BACKFILL_FAILED_MAX = int(os.getenv("DERIVATIVES_BACKFILL_FAILED_MAX", "10000"))
+# First key of the (namespace, step id) advisory locks backfill claims take
+BACKFILL_LOCK_NAMESPACE = 0x5354  # "ST"
+# Max differing dHash bits for two consecutive screenshots to count as the same screen
+PHASH_DUPLICATE_DISTANCE = int(os.getenv("PHASH_DUPLICATE_DISTANCE", "4"))
+
+def derivative_key(screenshot_key: str, variant: str, ext: str) -> str:
+    return f"{screenshot_key}__{variant}.{ext}"
+
+def record_asset_metadata(db, tenant_id: int, key: str, data: bytes) -> Optional[ScreenshotAsset]:
+    """Store dimensions, size, MIME type, SHA-256 and perceptual hash of an uploaded screenshot.
+    Returns None, and deletes the object, if a content-addressed key holds other bytes."""
+    asset = db.query(ScreenshotAsset).filter(ScreenshotAsset.key == key).first()
+    if asset:
+        return asset
+
+    sha256 = hashlib.sha256(data).hexdigest()
+    claimed = content_address(key)
+    if claimed is not None and claimed != sha256:
+        # Dedup lookups trust recorded content-addressed assets, so these bytes
+        # must never be recorded (or served under this key)
+        print(f"Rejected {key}: content has SHA-256 {sha256}; deleting the object")
+        delete_object(key)
+        return None
+
+    width = height = mime_type = phash = None
+    try:
+        img = PILImage.open(BytesIO(data))  # reads the header only
+        width, height = img.size
+        mime_type = PILImage.MIME.get(img.format)
+        phash = dhash(img)
+    except Exception as e:
+        print(f"Could not read image {key}: {e}")
+
+    asset = ScreenshotAsset(
+        tenant_id=tenant_id,
+        key=key,
+        width=width,
+        height=height,
+        byte_size=len(data),
+        mime_type=mime_type,
+        sha256=sha256,
+        phash=phash
+    )
+    db.add(asset)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Recorded concurrently (finalize call and step derivatives)
+        db.rollback()
+        asset = db.query(ScreenshotAsset).filter(ScreenshotAsset.key == key).first()
+    return asset
+
+def ingest_asset(db, tenant_id: int, key: str) -> bool:
+    """Download an uploaded screenshot and record its metadata"""
+    if db.query(ScreenshotAsset.id).filter(ScreenshotAsset.key == key).first():
+        return True
+    try:
+        response = s3_client.get_object(Bucket=S3_BUCKET, Key=key)
+        data = response['Body'].read()
+    except Exception as e:
+        print(f"Error downloading upload {key}: {e}")
+        return False
+    return record_asset_metadata(db, tenant_id, key, data) is not None
+
+def mark_near_duplicate(db, step: Step) -> Optional[int]:
+    """Flag the step as a duplicate of the previous step in its guide (or session)
+    when both screenshots are the same object or their perceptual hashes are
+    within PHASH_DUPLICATE_DISTANCE bits. Runs of duplicates all point at the
+    first frame. Returns the step id it duplicates, if any."""
+    if PHASH_DUPLICATE_DISTANCE < 0 or not step.screenshot_key:
+        return None
+    if step.guide_id is not None:
+        scope = Step.guide_id == step.guide_id
+    elif step.session_id is not None:
+        scope = Step.session_id == step.session_id
+    else:
+        return None
+    previous = db.query(Step).filter(
+        scope,
+        Step.index < step.index,
+        Step.screenshot_key.isnot(None)
+    ).order_by(Step.index.desc()).first()
+    if not previous:
+        return None
+
+    duplicate = previous.screenshot_key == step.screenshot_key
+    if not duplicate:
+        hashes = dict(db.query(ScreenshotAsset.key, ScreenshotAsset.phash).filter(
+            ScreenshotAsset.key.in_([previous.screenshot_key, step.screenshot_key])
+        ).all())
+        ours, theirs = hashes.get(step.screenshot_key), hashes.get(previous.screenshot_key)
+        duplicate = bool(ours and theirs) and hamming_distance(ours, theirs) <= PHASH_DUPLICATE_DISTANCE
+    if not duplicate:
+        return None
+
+    step.duplicate_of_step_id = previous.duplicate_of_step_id or previous.id
+    return step.duplicate_of_step_id
+
+def share_derivatives(db, step: Step, missing: dict) -> dict:
+    """Copy variant keys from another step with the same (content-addressed)
+    screenshot. Returns the variants still missing."""
+    other = db.query(Step).filter(
+        Step.screenshot_key == step.screenshot_key,
+        Step.id != step.id,
+        *[getattr(Step, spec[0]).isnot(None) for spec in missing.values()]
+    ).first()
+    if not other:
+        return missing
+    for column, *_ in missing.values():
+        setattr(step, column, getattr(other, column))
+    return {}
+
+def _commit_step(db, step: Step):
+    """Commit step changes; new variant keys or duplicate flags change how the
+    step's guide renders, so its ETags are invalidated too"""
+    if step.guide_id is not None and db.is_modified(step):
+        bump_guide_version(db, step.guide_id)
+    db.commit()
+
+def generate_derivatives(db, step_id: int) -> bool:
+    """Create any missing variants and metadata for a step's screenshot. Returns
+    False if the step has no screenshot or anything could not be processed."""
+    step = db.query(Step).filter(Step.id == step_id).first()
+    if not step or not step.screenshot_key:
+        return False
+
+    missing = {name: spec for name, spec in DERIVATIVES.items() if not getattr(step, spec[0])}
+    if missing:
+        missing = share_derivatives(db, step, missing)
+    has_metadata = db.query(ScreenshotAsset.id).filter(ScreenshotAsset.key == step.screenshot_key).first()
+    if not missing and has_metadata:
+        mark_near_duplicate(db, step)
+        _commit_step(db, step)
+        return True
+
+    try:
+        response = s3_client.get_object(Bucket=S3_BUCKET, Key=step.screenshot_key)
+        original = response['Body'].read()
+    except Exception as e:
+        print(f"Error downloading screenshot for step {step_id}: {e}")
+        return False
+
+    if not has_metadata and record_asset_metadata(db, step.tenant_id, step.screenshot_key, original) is None:
+        return False
+    mark_near_duplicate(db, step)
+
+    ok = True
+    for name, (column, params, ext, content_type) in missing.items():
+        try:
+            data, info = image_stage.process(original, **params)
+            key = derivative_key(step.screenshot_key, name, ext)
+            s3_client.upload_fileobj(BytesIO(data), S3_BUCKET, key, ExtraArgs={'ContentType': content_type})
+            setattr(step, column, key)
+        except Exception as e:
+            print(f"Error generating {name} derivative for step {step_id}: {e}")
+            ok = False
+
+    _commit_step(db, step)
+    return ok
+
+def steps_missing_derivatives(db, limit: int = BACKFILL_BATCH, exclude=()) -> list:
+    """Ids of steps with a screenshot but without every variant or without
+    recorded metadata (backfill for steps uploaded before these existed, or
+    whose queue entry was lost)"""
+    rows = db.query(Step.id).outerjoin(
+        ScreenshotAsset, ScreenshotAsset.key == Step.screenshot_key
+    ).filter(
+        Step.screenshot_key.isnot(None),
+        Step.id.notin_(list(exclude)),
+        or_(
+            ScreenshotAsset.id.is_(None),
+            *[getattr(Step, spec[0]).is_(None) for spec in DERIVATIVES.values()]
+        )
+    ).order_by(Step.id.desc()).limit(limit).all()
+    return [row.id for row in rows]
+
+def claim_step(db, step_id: int) -> bool:
+    """Take a transaction-scoped advisory lock on a step, held until db's
+    transaction ends; False if another replica's backfill holds it. A lock
+    rather than SELECT ... FOR UPDATE, since generate_derivatives updates the
+    step row from its own session while the claim is held."""
+    return bool(db.execute(
+        text("SELECT pg_try_advisory_xact_lock(:namespace, :step_id)"),
+        {"namespace": BACKFILL_LOCK_NAMESPACE, "step_id": step_id}
+    ).scalar())
+
+class DerivativeWorker:
+    """Thread in the worker process that indexes finalized uploads and generates
+    screenshot variants and metadata as steps are created. Runs alongside export
+    dispatch and shares the image process pool."""
+
+    def __init__(self, session_factory, job_queue, shutdown: threading.Event,
+                 backfill_interval: float = 300.0, timeout: float = 5.0):
+        self.session_factory = session_factory
+        self.job_queue = job_queue
+        self.shutdown = shutdown
+        self.backfill_interval = backfill_interval
+        self.timeout = timeout
+        self.last_backfill = 0.0
+        self._failed = {}  # step id -> time it failed, oldest first; skipped by the backfill for a while
+        self._thread = threading.Thread(target=self._run, name="derivatives", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def join(self, timeout: Optional[float] = None):
+        self._thread.join(timeout)
+
+    def _mark_failed(self, step_id: int):
+        self._failed.pop(step_id, None)
+        self._failed[step_id] = time.monotonic()
+        while len(self._failed) > BACKFILL_FAILED_MAX:
+            del self._failed[next(iter(self._failed))]
+
+    def _recently_failed(self) -> list:
+        """Failed steps the backfill should still skip; older failures are retried"""
+        cutoff = time.monotonic() - BACKFILL_RETRY_SECONDS
+        while self._failed:
+            step_id, failed_at = next(iter(self._failed.items()))
+            if failed_at >= cutoff:
+                break
+            del self._failed[step_id]
+        return list(self._failed)
+
+    def _process(self, step_id: int):
+        db = self.session_factory()
+        try:
+            if generate_derivatives(db, step_id):
+                self._failed.pop(step_id, None)
+            else:
+                self._mark_failed(step_id)
+        except Exception as e:
+            print(f"Error generating derivatives for step {step_id}: {e}")
+            db.rollback()
+            self._mark_failed(step_id)
+        finally:
+            db.close()
+
+    def _ingest(self, payload: str):
+        tenant_id, _, key = payload.partition(":")
+        db = self.session_factory()
+        try:
+            ingest_asset(db, int(tenant_id), key)
+        except Exception as e:
+            print(f"Error indexing upload {key}: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def _backfill(self):
+        db = self.session_factory()
+        try:
+            step_ids = steps_missing_derivatives(db, exclude=self._recently_failed())
+        finally:
+            db.close()
+        # Every replica backfills; each step is claimed so only one of them processes it
+        for step_id in step_ids:
+            if self.shutdown.is_set():
+                return
+            claim = self.session_factory()
+            try:
+                if claim_step(claim, step_id):
+                    self._process(step_id)
+            finally:
+                claim.rollback()
+                claim.close()
+
+    def _run(self):
+        while not self.shutdown.is_set():
+            try:
+                item = self.job_queue.dequeue([ASSETS_QUEUE, DERIVATIVES_QUEUE], timeout=self.timeout)
+                if item is not None and item[0] == ASSETS_QUEUE:
+                    self._ingest(item[1])
+                elif item is not None:
+                    self._process(int(item[1]))
+                elif time.time() - self.last_backfill >= self.backfill_interval:
+                    self.last_backfill = time.time()
+                    self._backfill()
+            except Exception as e:
+                print(f"Error in derivatives loop: {e}")
+                time.sleep(5)
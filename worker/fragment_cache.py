@@ -0,0 +1,114 @@
+import os
+import hashlib
+import json
+import tempfile
+import threading
+from typing import Optional
+from botocore.exceptions import ClientError
+
+from storage import s3_client, S3_BUCKET
+
+FRAGMENT_CACHE_DIR = os.getenv("EXPORT_FRAGMENT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "snapstep-fragments"))
+FRAGMENT_CACHE_MAX_MB = int(os.getenv("EXPORT_FRAGMENT_CACHE_MAX_MB", "1024"))
+# Optional shared tier so replicas and recycled worker processes share fragments
+FRAGMENT_CACHE_S3_PREFIX = os.getenv("EXPORT_FRAGMENT_CACHE_S3_PREFIX", "")  # e.g. "cache/fragments/"
+
+# Bump when the way fragments are rendered changes
+FRAGMENT_VERSION = 2
+
+def fragment_key(screenshot_key: str, params: dict) -> str:
+    """Cache key for a step's rendered screenshot. screenshot_key identifies the
+    screenshot's content: its SHA-256 when known, else its object key (uploads are
+    written once under a unique key). Annotated renders carry the annotation set
+    hash in params."""
+    payload = json.dumps({"v": FRAGMENT_VERSION, "screenshot": screenshot_key, "params": params}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+class FragmentCache:
+    """Rendered per-step fragments on local disk, optionally backed by S3"""
+
+    def __init__(self, directory: str = FRAGMENT_CACHE_DIR, max_mb: int = FRAGMENT_CACHE_MAX_MB,
+                 s3_prefix: str = FRAGMENT_CACHE_S3_PREFIX):
+        self.directory = directory
+        self.max_bytes = max_mb * 1024 * 1024
+        self.s3_prefix = s3_prefix
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # keep recently used fragments out of the prune
+            return data
+        except OSError:
+            pass
+
+        if self.s3_prefix:
+            try:
+                response = s3_client.get_object(Bucket=S3_BUCKET, Key=f"{self.s3_prefix}{key}")
+                data = response['Body'].read()
+                self._write_local(key, data)
+                return data
+            except ClientError:
+                pass
+        return None
+
+    def put(self, key: str, data: bytes):
+        self._write_local(key, data)
+        if self.s3_prefix:
+            try:
+                s3_client.put_object(Bucket=S3_BUCKET, Key=f"{self.s3_prefix}{key}", Body=data)
+            except ClientError as e:
+                print(f"Error storing fragment {key} in S3: {e}")
+
+    def _write_local(self, key: str, data: bytes):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so concurrent readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing fragment {key}: {e}")
+            return
+
+        with self._lock:
+            self._writes_since_prune += 1
+            if self._writes_since_prune < 100:
+                return
+            self._writes_since_prune = 0
+        self.prune()
+
+    def prune(self):
+        """Delete least recently used fragments until under max size"""
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+fragment_cache = FragmentCache()
@@ -0,0 +1,124 @@
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+from PIL import Image as PILImage
+
+from annotations import composite_annotations
+
+# CPU stage of the export pipeline, sized independently of the network prefetch
+# threads. Every process that renders exports owns its own pool: in process mode
+# a replica runs WORKER_CONCURRENCY x (1 + EXPORT_IMAGE_WORKERS) export
+# processes. So when exports already run in parallel processes the default is 0
+# (images are processed inline in each export process); a serial or single-job
+# worker gets one image process per core.
+_PARALLEL_EXPORTS = (os.getenv("WORKER_MODE", "process") == "process"
+                     and int(os.getenv("WORKER_CONCURRENCY", "2")) > 1)
+_DEFAULT_IMAGE_WORKERS = 0 if _PARALLEL_EXPORTS else (os.cpu_count() or 1)
+IMAGE_WORKERS = int(os.getenv("EXPORT_IMAGE_WORKERS", str(_DEFAULT_IMAGE_WORKERS)))
+
+def process_image(data: bytes, max_width: int = 600, max_height: Optional[int] = None,
+                  image_format: str = "PNG", quality: Optional[int] = None,
+                  annotations: Optional[List[dict]] = None,
+                  source_width: Optional[int] = None) -> Tuple[bytes, Dict[str, float]]:
+    """Decode, burn in annotations, shrink to fit max_width x max_height (aspect
+    preserved) and re-encode. source_width is the width of the original screenshot
+    the annotation coordinates refer to, if data is a smaller derivative.
+    Returns (encoded_bytes, info) where info holds the output width/height and
+    per-phase timings in ms. Top-level so it can run in a child process."""
+    info = {}
+
+    started = time.perf_counter()
+    img = PILImage.open(BytesIO(data))
+    img.load()
+    info["decode_ms"] = (time.perf_counter() - started) * 1000
+
+    if annotations:
+        started = time.perf_counter()
+        scale = img.width / source_width if source_width else 1.0
+        img = composite_annotations(img, annotations, scale)
+        info["annotate_ms"] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    width, height = img.size
+    ratio = min(1.0, max_width / width, (max_height / height) if max_height else 1.0)
+    if ratio < 1.0:
+        img = img.resize((max(1, int(width * ratio)), max(1, int(height * ratio))), PILImage.Resampling.LANCZOS)
+    info["resize_ms"] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    output = BytesIO()
+    if image_format == "JPEG":
+        if img.mode in ("RGBA", "LA", "P"):
+            # JPEG has no alpha: flatten onto white like the PDF page
+            rgba = img.convert("RGBA")
+            img = PILImage.new("RGB", rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.split()[3])
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+        img.save(output, format="JPEG", quality=quality or 85, optimize=True)
+    elif image_format == "WEBP":
+        img.save(output, format="WEBP", quality=quality or 80, method=4)
+    else:
+        img.save(output, format="PNG", optimize=False)
+    info["encode_ms"] = (time.perf_counter() - started) * 1000
+    info["width"], info["height"] = img.size
+
+    return output.getvalue(), info
+
+def dhash(img: PILImage.Image, size: int = 8) -> str:
+    """Perceptual difference hash: 64 bits, one per horizontally adjacent pixel
+    pair of a (size+1) x size grayscale thumbnail. Near-identical screenshots
+    differ in only a few bits."""
+    img.draft("L", (size * 4, size * 4))  # cheap JPEG downscale on decode
+    small = img.convert("L").resize((size + 1, size), PILImage.Resampling.BILINEAR)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            bits = (bits << 1) | (left > pixels[row * (size + 1) + col + 1])
+    return f"{bits:0{size * size // 4}x}"
+
+def hamming_distance(a: str, b: str) -> int:
+    """Number of differing bits between two hex hashes"""
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+class ImageProcessingStage:
+    """Runs process_image on a pool of processes shared by every export in this process.
+
+    With workers=0 images are processed inline on the calling thread."""
+
+    def __init__(self, workers: int = IMAGE_WORKERS):
+        self.workers = workers
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    # spawn: the caller has prefetch and heartbeat threads running,
+                    # which makes fork unsafe
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn")
+                    )
+        return self._pool
+
+    def process(self, data: bytes, **params) -> Tuple[bytes, Dict[str, float]]:
+        """Resize and encode one image (see process_image), blocking the calling thread until done"""
+        if self.workers <= 0:
+            return process_image(data, **params)
+        return self._get_pool().submit(process_image, data, **params).result()
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._pool = None
+
+image_stage = ImageProcessingStage()
@@ -0,0 +1,124 @@
+import os
+import socket
+import threading
+from datetime import timedelta
+from typing import List, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import ExportJob, ExportJobStatus
+
+LEASE_SECONDS = int(os.getenv("WORKER_LEASE_SECONDS", "60"))
+HEARTBEAT_INTERVAL = float(os.getenv("WORKER_HEARTBEAT_INTERVAL", "15"))
+MAX_ATTEMPTS = int(os.getenv("WORKER_MAX_ATTEMPTS", "3"))
+
+def get_worker_id() -> str:
+    """Identify this worker process across replicas"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def _lease_deadline():
+    # Computed by the database so replicas with skewed clocks agree on expiry
+    return func.now() + timedelta(seconds=LEASE_SECONDS)
+
+def claim_job(db: Session, job_id: int, worker_id: str) -> Optional[ExportJob]:
+    """Atomically move a PENDING job to PROCESSING under a lease held by worker_id.
+    Returns None if the job is gone, not pending, or locked by another worker."""
+    job = db.query(ExportJob).filter(
+        ExportJob.id == job_id,
+        ExportJob.status == ExportJobStatus.PENDING
+    ).with_for_update(skip_locked=True).first()
+
+    if not job:
+        db.rollback()
+        return None
+
+    job.status = ExportJobStatus.PROCESSING
+    job.worker_id = worker_id
+    job.lease_expires_at = _lease_deadline()
+    job.heartbeat_at = func.now()
+    job.attempts = (job.attempts or 0) + 1
+    db.commit()
+    db.refresh(job)
+    return job
+
+def renew_lease(db: Session, job_id: int, worker_id: str) -> bool:
+    """Extend the lease on a job. Returns False if this worker no longer owns it."""
+    updated = db.query(ExportJob).filter(
+        ExportJob.id == job_id,
+        ExportJob.worker_id == worker_id,
+        ExportJob.status == ExportJobStatus.PROCESSING
+    ).update({
+        ExportJob.lease_expires_at: _lease_deadline(),
+        ExportJob.heartbeat_at: func.now()
+    }, synchronize_session=False)
+    db.commit()
+    return updated == 1
+
+def finish_job(db: Session, job_id: int, worker_id: str, values: dict) -> bool:
+    """Write the final state of a job, but only while this worker still holds the lease.
+    Returns False if the lease was lost (reaped and possibly claimed elsewhere)."""
+    values = dict(values)
+    values.update({ExportJob.lease_expires_at: None})
+    updated = db.query(ExportJob).filter(
+        ExportJob.id == job_id,
+        ExportJob.worker_id == worker_id,
+        ExportJob.status == ExportJobStatus.PROCESSING
+    ).update(values, synchronize_session=False)
+    db.commit()
+    return updated == 1
+
+def reap_expired_leases(db: Session) -> List[int]:
+    """Return jobs whose lease has expired (worker crashed or hung) to PENDING,
+    or FAILED once they have used up MAX_ATTEMPTS. Returns ids made PENDING again."""
+    expired = db.query(ExportJob).filter(
+        ExportJob.status == ExportJobStatus.PROCESSING,
+        ExportJob.lease_expires_at < func.now()
+    ).with_for_update(skip_locked=True).all()
+
+    requeued = []
+    for job in expired:
+        print(f"Lease expired for export job {job.id} (worker {job.worker_id}, attempt {job.attempts})")
+        if (job.attempts or 0) >= MAX_ATTEMPTS:
+            job.status = ExportJobStatus.FAILED
+            job.error_message = f"Lease expired after {job.attempts} attempts"
+        else:
+            job.status = ExportJobStatus.PENDING
+            requeued.append(job.id)
+        job.worker_id = None
+        job.lease_expires_at = None
+
+    db.commit()
+    return requeued
+
+class LeaseHeartbeat:
+    """Background thread that keeps a job's lease alive while it is being rendered"""
+
+    def __init__(self, session_factory, job_id: int, worker_id: str, interval: float = HEARTBEAT_INTERVAL):
+        self.session_factory = session_factory
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.interval = interval
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"heartbeat-{job_id}", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            db = self.session_factory()
+            try:
+                if not renew_lease(db, self.job_id, self.worker_id):
+                    print(f"Lost lease on export job {self.job_id}")
+                    self.lost = True
+                    return
+            except Exception as e:
+                print(f"Error renewing lease on export job {self.job_id}: {e}")
+            finally:
+                db.close()
@@ -0,0 +1,137 @@
+import os
+import tempfile
+import threading
+from io import BytesIO
+from boto3.s3.transfer import TransferConfig
+from reportlab.platypus import Image
+
+from storage import s3_client, S3_BUCKET
+
+# spooled: PDF and screenshots spill to temp files past a size threshold and the
+# PDF is streamed to S3 with a multipart upload. memory: everything in BytesIO.
+EXPORT_OUTPUT_MODE = os.getenv("EXPORT_OUTPUT_MODE", "spooled")
+PDF_SPOOL_BYTES = int(os.getenv("EXPORT_PDF_SPOOL_BYTES", str(8 * 1024 * 1024)))
+IMAGE_SPOOL_BYTES = int(os.getenv("EXPORT_IMAGE_SPOOL_BYTES", str(512 * 1024)))
+
+MULTIPART_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=4
+)
+
+def streaming_enabled() -> bool:
+    return EXPORT_OUTPUT_MODE == "spooled"
+
+def new_pdf_buffer():
+    """Destination for doc.build()"""
+    if streaming_enabled():
+        return tempfile.SpooledTemporaryFile(max_size=PDF_SPOOL_BYTES, suffix=".pdf")
+    return BytesIO()
+
+def image_buffer(data: bytes):
+    """Hold an encoded screenshot until it is drawn"""
+    if not streaming_enabled():
+        return BytesIO(data)
+    spool = tempfile.SpooledTemporaryFile(max_size=IMAGE_SPOOL_BYTES)
+    spool.write(data)
+    spool.seek(0)
+    return spool
+
+class ReleasingImage(Image):
+    """Image flowable that frees its source data once it has been drawn on a page,
+    so a long story does not keep every screenshot alive until the build ends."""
+
+    def __init__(self, source, *args, **kwargs):
+        super().__init__(source, *args, **kwargs)
+        # Image keeps only repr(source) in self.filename; the stream itself is self._file
+        self._source = source if hasattr(source, "read") else None
+
+    def draw(self):
+        super().draw()
+        self._file = None
+        self._img = None
+        if self._source is not None:
+            self._source.close()
+            self._source = None
+
+def upload_pdf(buffer, key: str):
+    """Upload a built PDF without copying it into a single bytes object"""
+    buffer.seek(0)
+    if streaming_enabled():
+        s3_client.upload_fileobj(
+            buffer, S3_BUCKET, key,
+            ExtraArgs={'ContentType': 'application/pdf'},
+            Config=MULTIPART_CONFIG
+        )
+    else:
+        s3_client.put_object(
+            Bucket=S3_BUCKET,
+            Key=key,
+            Body=buffer.getvalue(),
+            ContentType='application/pdf'
+        )
+
+RSS_SAMPLE_INTERVAL = float(os.getenv("EXPORT_RSS_SAMPLE_INTERVAL", "0.1"))
+_PAGE_KB = os.sysconf("SC_PAGE_SIZE") // 1024
+
+def current_rss_kb(pid="self") -> int:
+    """Resident memory of a process right now (KB, Linux); 0 if it is gone"""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_KB
+    except (OSError, IndexError, ValueError):
+        return 0
+
+def child_pids() -> list:
+    """Direct children of this process, e.g. the image stage's pool"""
+    parent = str(os.getpid())
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # "pid (comm) state ppid ..."; comm may contain spaces
+                ppid = f.read().rsplit(")", 1)[1].split()[1]
+        except (OSError, IndexError):
+            continue
+        if ppid == parent:
+            pids.append(entry)
+    return pids
+
+def tree_rss_kb() -> int:
+    """Current resident memory of this process plus its children"""
+    return current_rss_kb() + sum(current_rss_kb(pid) for pid in child_pids())
+
+class RssSampler:
+    """Samples tree_rss_kb() on a background thread while the block runs.
+
+    ru_maxrss is a lifetime high-water mark, so it says nothing about one job in a
+    reused process and does not see the image stage's processes; this measures
+    the job itself: start_kb when it began and peak_kb while it ran."""
+
+    def __init__(self, interval: float = RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.start_kb = 0
+        self.peak_kb = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        self.peak_kb = max(self.peak_kb, tree_rss_kb())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def __enter__(self):
+        self.start_kb = self.peak_kb = tree_rss_kb()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+        return False
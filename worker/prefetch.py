@@ -0,0 +1,48 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, Tuple, Any, Optional
+
+from storage import S3_MAX_POOL_CONNECTIONS
+
+PREFETCH_WORKERS = int(os.getenv("EXPORT_PREFETCH_WORKERS", "8"))
+PREFETCH_WINDOW = int(os.getenv("EXPORT_PREFETCH_WINDOW", "16"))
+
+_END = object()
+
+class ScreenshotPrefetcher:
+    """Loads screenshots on a bounded thread pool ahead of the consumer.
+    
+    At most `window` loads are submitted ahead of the item being consumed, so
+    memory stays bounded on long guides while S3 round trips overlap. Results
+    are yielded in input order."""
+    
+    def __init__(self, max_workers: int = PREFETCH_WORKERS, window: int = PREFETCH_WINDOW):
+        # Threads beyond the shared S3 client's pool size would just queue on it
+        self.max_workers = max(1, min(max_workers, S3_MAX_POOL_CONNECTIONS))
+        self.window = max(1, window)
+    
+    def map(self, load: Callable[[Any], Any], items: Iterable[Any]) -> Iterator[Tuple[Any, Any, Optional[Exception]]]:
+        """Yield (item, result, error) for each item in order. Exactly one of
+        result/error is set; errors are returned rather than raised so one bad
+        screenshot does not abort the export."""
+        items = iter(items)
+        pending = deque()
+        pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="prefetch")
+        try:
+            for item in items:
+                pending.append((item, pool.submit(load, item)))
+                if len(pending) >= self.window:
+                    break
+            
+            while pending:
+                item, future = pending.popleft()
+                next_item = next(items, _END)
+                if next_item is not _END:
+                    pending.append((next_item, pool.submit(load, next_item)))
+                try:
+                    yield item, future.result(), None
+                except Exception as e:
+                    yield item, None, e
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
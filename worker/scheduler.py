@@ -0,0 +1,219 @@
+import os
+import time
+from collections import deque
+from typing import Dict, NamedTuple, Optional
+
+TENANT_MAX_CONCURRENCY = int(os.getenv("SCHEDULER_TENANT_MAX_CONCURRENCY", "2"))
+# A job waiting longer than this is served before newer higher-priority work
+AGING_SECONDS = float(os.getenv("SCHEDULER_AGING_SECONDS", "120"))
+
+class ScheduledJob(NamedTuple):
+    job_id: int
+    tenant_id: int
+    priority: int  # lower runs first (see exports.EXPORT_PRIORITIES)
+    enqueued_at: float
+
+class FairScheduler:
+    """Picks the next export job to run.
+
+    Jobs are grouped by priority, then by tenant. Higher priorities are served
+    first; within a priority, tenants take turns (round robin), so a tenant with
+    200 queued jobs gets one slot per turn like everyone else. A tenant with
+    `tenant_cap` jobs already running is skipped. Jobs older than `aging_seconds`
+    are served ahead of priority so bulk work cannot starve forever."""
+
+    def __init__(self, tenant_cap: int = TENANT_MAX_CONCURRENCY, aging_seconds: float = AGING_SECONDS,
+                 clock=time.monotonic):
+        self.tenant_cap = tenant_cap
+        self.aging_seconds = aging_seconds
+        self.clock = clock
+        self._queues: Dict[int, Dict[int, deque]] = {}  # priority -> tenant -> jobs
+        self._turns: Dict[int, deque] = {}  # priority -> tenant round-robin order
+        self._queued_ids = set()
+
+    def __len__(self):
+        return len(self._queued_ids)
+
+    def push(self, job_id: int, tenant_id: int, priority: int = 0) -> bool:
+        """Add a job. Returns False if it is already queued."""
+        if job_id in self._queued_ids:
+            return False
+        self._queued_ids.add(job_id)
+        tenants = self._queues.setdefault(priority, {})
+        if tenant_id not in tenants:
+            tenants[tenant_id] = deque()
+            self._turns.setdefault(priority, deque()).append(tenant_id)
+        tenants[tenant_id].append(ScheduledJob(job_id, tenant_id, priority, self.clock()))
+        return True
+
+    def queued_by_tenant(self) -> Dict[int, int]:
+        """Number of queued jobs per tenant, across priorities"""
+        counts: Dict[int, int] = {}
+        for tenants in self._queues.values():
+            for tenant_id, jobs in tenants.items():
+                counts[tenant_id] = counts.get(tenant_id, 0) + len(jobs)
+        return counts
+
+    def pop(self, running: Optional[Dict[int, int]] = None) -> Optional[ScheduledJob]:
+        """Next job to run given the number of running jobs per tenant, or None if
+        nothing is runnable (empty, or every waiting tenant is at its cap)."""
+        running = running or {}
+
+        def runnable(tenant_id):
+            return running.get(tenant_id, 0) < self.tenant_cap
+
+        # Aged jobs first, oldest wins
+        now = self.clock()
+        aged = None
+        for tenants in self._queues.values():
+            for tenant_id, jobs in tenants.items():
+                head = jobs[0]
+                if now - head.enqueued_at >= self.aging_seconds and runnable(tenant_id):
+                    if aged is None or head.enqueued_at < aged.enqueued_at:
+                        aged = head
+        if aged is not None:
+            return self._take(aged.priority, aged.tenant_id)
+
+        for priority in sorted(self._queues):
+            turns = self._turns[priority]
+            for _ in range(len(turns)):
+                tenant_id = turns[0]
+                turns.rotate(-1)
+                if runnable(tenant_id):
+                    return self._take(priority, tenant_id)
+        return None
+
+    def _take(self, priority: int, tenant_id: int) -> ScheduledJob:
+        tenants = self._queues[priority]
+        job = tenants[tenant_id].popleft()
+        if not tenants[tenant_id]:
+            del tenants[tenant_id]
+            self._turns[priority].remove(tenant_id)
+            if not tenants:
+                del self._queues[priority]
+                del self._turns[priority]
+        self._queued_ids.discard(job.job_id)
+        return job
+
+class _FifoScheduler:
+    """Arrival order, no caps - what worker_loop did before, for comparison"""
+
+    def __init__(self):
+        self._jobs = deque()
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def push(self, job_id, tenant_id, priority=0):
+        self._jobs.append(ScheduledJob(job_id, tenant_id, priority, 0.0))
+        return True
+
+    def pop(self, running=None):
+        return self._jobs.popleft() if self._jobs else None
+
+def simulate(scheduler, workers: int = 4, noisy_jobs: int = 200, quiet_tenants: int = 5,
+             quiet_interval: float = 20.0, duration: float = 600.0, service_time: float = 5.0) -> Dict[int, list]:
+    """Discrete-event simulation of a noisy neighbour: tenant 1 bulk-exports
+    `noisy_jobs` guides at t=0 while each quiet tenant requests one interactive
+    export every `quiet_interval` seconds. Returns per-tenant latencies
+    (request to completion) in seconds."""
+    clock = [0.0]
+    scheduler.clock = lambda: clock[0]
+    arrivals = [(0.0, 1, 10) for _ in range(noisy_jobs)]
+    for tenant_id in range(2, quiet_tenants + 2):
+        t = (tenant_id - 2) * quiet_interval / quiet_tenants
+        while t < duration:
+            arrivals.append((t, tenant_id, 0))
+            t += quiet_interval
+    arrivals.sort(key=lambda a: a[0])
+
+    submitted_at = {}
+    latencies: Dict[int, list] = {}
+    running = []  # (finish_time, job)
+    running_by_tenant: Dict[int, int] = {}
+    next_arrival = 0
+    job_id = 0
+
+    while next_arrival < len(arrivals) or running or len(scheduler):
+        # Advance to the next event
+        events = []
+        if next_arrival < len(arrivals):
+            events.append(arrivals[next_arrival][0])
+        if running:
+            events.append(min(finish for finish, _ in running))
+        if not events:
+            break  # queued work that can never run
+        clock[0] = min(events)
+
+        for finish, job in [r for r in running if r[0] <= clock[0]]:
+            running.remove((finish, job))
+            running_by_tenant[job.tenant_id] -= 1
+            latencies.setdefault(job.tenant_id, []).append(finish - submitted_at[job.job_id])
+
+        while next_arrival < len(arrivals) and arrivals[next_arrival][0] <= clock[0]:
+            _, tenant_id, priority = arrivals[next_arrival]
+            job_id += 1
+            submitted_at[job_id] = clock[0]
+            scheduler.push(job_id, tenant_id, priority)
+            next_arrival += 1
+
+        while len(running) < workers:
+            job = scheduler.pop(running_by_tenant)
+            if job is None:
+                break
+            running.append((clock[0] + service_time, job))
+            running_by_tenant[job.tenant_id] = running_by_tenant.get(job.tenant_id, 0) + 1
+
+    return latencies
+
+def _percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+def check_noisy_neighbour(workers: int = 4, tenant_cap: int = 2, aging_seconds: float = 120.0,
+                          service_time: float = 5.0, noisy_jobs: int = 200):
+    """Assert the bounds FairScheduler promises under a noisy neighbour:
+
+    - with spare workers, a quiet tenant's interactive export waits for no
+      other tenant's job (latency within one extra service time), where FIFO
+      queues it behind the whole bulk backlog;
+    - the noisy tenant is capped, not starved: its last job finishes within
+      the time its backlog takes at `tenant_cap` slots, plus aging and one job;
+    - with interactive load saturating every worker, bulk jobs still start
+      within `aging_seconds` (plus one service time to free a worker).
+    Raises AssertionError with the offending latencies otherwise."""
+    noisy_bound = noisy_jobs * service_time / min(tenant_cap, workers) + aging_seconds + service_time
+
+    def run(scheduler, quiet_interval):
+        return simulate(scheduler, workers=workers, noisy_jobs=noisy_jobs, quiet_interval=quiet_interval,
+                        service_time=service_time)
+
+    fair = run(FairScheduler(tenant_cap, aging_seconds), quiet_interval=20.0)
+    fifo = run(_FifoScheduler(), quiet_interval=20.0)
+    assert len(fair[1]) == noisy_jobs, f"noisy tenant finished {len(fair[1])}/{noisy_jobs} jobs"
+    for tenant_id, values in fair.items():
+        if tenant_id == 1:
+            continue
+        assert max(values) <= 2 * service_time, f"quiet tenant {tenant_id} waited: max {max(values):.0f}s"
+        assert _percentile(values, 99) < _percentile(fifo[tenant_id], 99), \
+            f"tenant {tenant_id}: fair p99 not below FIFO p99"
+    assert max(fair[1]) <= noisy_bound, f"noisy tenant starved: max {max(fair[1]):.0f}s > {noisy_bound:.0f}s"
+
+    # Every worker busy with interactive exports: only aging gets bulk work through
+    saturated = run(FairScheduler(tenant_cap, aging_seconds), quiet_interval=1.0)
+    assert len(saturated[1]) == noisy_jobs, f"bulk jobs starved: {len(saturated[1])}/{noisy_jobs} finished"
+    assert max(saturated[1]) <= noisy_bound, \
+        f"bulk jobs starved under interactive load: max {max(saturated[1]):.0f}s > {noisy_bound:.0f}s"
+
+if __name__ == "__main__":
+    # python scheduler.py - compare tail latency per tenant under a noisy neighbour,
+    # then check the fairness bounds (exits non-zero if one is violated)
+    for name, scheduler in (("fifo", _FifoScheduler()), ("fair", FairScheduler())):
+        print(f"{name}:")
+        for tenant_id, values in sorted(simulate(scheduler).items()):
+            label = "noisy" if tenant_id == 1 else "quiet"
+            print(f"  tenant {tenant_id} ({label}, {len(values)} jobs): "
+                  f"p50 {_percentile(values, 50):.0f}s  p95 {_percentile(values, 95):.0f}s  "
+                  f"p99 {_percentile(values, 99):.0f}s  max {max(values):.0f}s")
+    check_noisy_neighbour()
+    print("fairness bounds hold")
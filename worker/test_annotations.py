@@ -0,0 +1,19 @@
+import pytest
+from PIL import Image as PILImage
+
+from annotations import composite_annotations, RedactionError
+
+def test_malformed_region_effect_fails_instead_of_leaking():
+    img = PILImage.new("RGB", (100, 100), (255, 255, 255))
+    with pytest.raises(RedactionError):
+        composite_annotations(img, [{"type": "blur", "data": {"x": 10, "y": 10, "width": "wide"}}])
+    with pytest.raises(RedactionError):
+        composite_annotations(img, [{"type": "pixelate", "data": ["not", "a", "box"]}])
+
+def test_malformed_shape_is_skipped():
+    img = PILImage.new("RGB", (100, 100), (255, 255, 255))
+    out = composite_annotations(img, [
+        {"type": "rectangle", "data": {"x": 10}},
+        {"type": "rectangle", "data": {"x": 10, "y": 10, "width": 20, "height": 20, "color": "#000000"}},
+    ])
+    assert out.getpixel((10, 10)) == (0, 0, 0)
@@ -0,0 +1,25 @@
+from io import BytesIO
+from PIL import Image as PILImage
+from reportlab.lib.pagesizes import letter
+from reportlab.platypus import SimpleDocTemplate
+
+import main  # puts the backend on sys.path, like the worker entrypoint
+from pdf_output import ReleasingImage, RssSampler, image_buffer
+
+def png_bytes(size=(64, 48)) -> bytes:
+    output = BytesIO()
+    PILImage.new("RGB", size, (200, 30, 30)).save(output, format="PNG")
+    return output.getvalue()
+
+def test_screenshot_buffers_closed_after_build():
+    buffers = [image_buffer(png_bytes()) for _ in range(3)]
+    doc = SimpleDocTemplate(BytesIO(), pagesize=letter)
+    doc.build([ReleasingImage(buffer, width=64, height=48) for buffer in buffers])
+    assert all(buffer.closed for buffer in buffers)
+
+def test_rss_sampler_sees_memory_allocated_during_block():
+    with RssSampler(interval=0.01) as rss:
+        ballast = bytearray(64 * 1024 * 1024)
+        rss.sample()
+        del ballast
+    assert rss.peak_kb - rss.start_kb >= 48 * 1024
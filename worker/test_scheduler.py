@@ -0,0 +1,60 @@
+import main
+from job_queue import InMemoryJobQueue, EXPORTS_QUEUE, EXPORTS_BULK_QUEUE
+from scheduler import FairScheduler, check_noisy_neighbour
+
+def make_source(queue, running, buffer_size=2, tenant_cap=2):
+    source = main.JobSource(queue, FairScheduler(tenant_cap=tenant_cap), buffer_size=buffer_size,
+                            running_jobs=lambda: dict(running), sweep=lambda limit: [])
+    source.sleep = lambda seconds: None
+    return source
+
+def test_noisy_neighbour_bounds():
+    check_noisy_neighbour()
+
+def test_capped_tenant_backlog_stays_in_queue(monkeypatch):
+    monkeypatch.setattr(main, "QUEUE_BLOCK_TIMEOUT", 0.01)
+    queue = InMemoryJobQueue()
+    for job_id in range(1, 51):
+        queue.enqueue_fair(EXPORTS_BULK_QUEUE, 1, job_id)
+    source = make_source(queue, running={1: 2})
+
+    for _ in range(20):
+        assert source.next_job() is None
+        assert len(source.scheduler) <= source.buffer_size
+    assert queue.fair_depth(EXPORTS_BULK_QUEUE) == 50
+
+    # A quiet tenant's bulk job does not wait behind the noisy tenant's backlog
+    queue.enqueue_fair(EXPORTS_BULK_QUEUE, 2, 1001)
+    assert source.next_job() == 1001
+
+def test_buffer_never_exceeds_bound(monkeypatch):
+    monkeypatch.setattr(main, "QUEUE_BLOCK_TIMEOUT", 0.01)
+    queue = InMemoryJobQueue()
+    for job_id in range(1, 21):
+        queue.enqueue_fair(EXPORTS_BULK_QUEUE, job_id % 4, job_id)
+    # Every tenant has one job running elsewhere, so each buffered job is one below the cap
+    source = make_source(queue, running={tenant_id: 1 for tenant_id in range(4)}, buffer_size=3)
+
+    dispatched = []
+    for _ in range(30):
+        job_id = source.next_job()
+        assert len(source.scheduler) <= source.buffer_size
+        if job_id is not None:
+            dispatched.append(job_id)
+    # One more job per tenant fits under the cap; the rest stays queued
+    assert len(dispatched) == 4
+    assert len(dispatched) + len(source.scheduler) + queue.fair_depth(EXPORTS_BULK_QUEUE) == 20
+
+def test_tenants_take_turns_and_interactive_goes_first(monkeypatch):
+    monkeypatch.setattr(main, "QUEUE_BLOCK_TIMEOUT", 0.01)
+    queue = InMemoryJobQueue()
+    for job_id in range(1, 11):
+        queue.enqueue_fair(EXPORTS_BULK_QUEUE, 1, job_id)
+    for job_id in range(101, 104):
+        queue.enqueue_fair(EXPORTS_BULK_QUEUE, 2, job_id)
+    queue.enqueue_fair(EXPORTS_QUEUE, 3, 201)
+    source = make_source(queue, running={}, buffer_size=2, tenant_cap=100)
+
+    order = [source.next_job() for _ in range(7)]
+    assert order[0] == 201
+    assert sorted(job_id for job_id in order if job_id > 100 and job_id != 201) == [101, 102, 103]